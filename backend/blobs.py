@@ -0,0 +1,146 @@
+"""
+Content-addressed storage for downloaded papers.
+The same PDF is often published by several sources under different URLs, so
+each distinct file is stored once under its sha256 in temp_downloads/blobs.
+Per-URL cache entries and the CLI's subject trees are hard links to the blob,
+and a blob is deleted with the last of them. Python has no portable reflink
+(copy-on-write clone), so where a hard link is impossible (another filesystem,
+FAT drives) a plain copy is made instead, and downloads are cached unshared.
+"""
+import os
+import shutil
+from typing import Dict
+
+try:
+    from backend.diskio import atomic_path
+    from backend.shared_state import StateStore
+except ImportError:
+    from diskio import atomic_path
+    from shared_state import StateStore
+
+
+class BlobStore:
+    """Store files once by content hash and hand out links to them."""
+
+    def __init__(self, root: str, state: StateStore):
+        self.root = root
+        self.state = state
+        os.makedirs(root, exist_ok=True)
+        # Savings made by this process, e.g. one CLI run
+        self.duplicates = 0
+        self.bytes_saved = 0
+
+    def blob_path(self, digest: str) -> str:
+        """Return where the file with this sha256 hex digest is stored."""
+        return os.path.join(self.root, f"{digest}.pdf")
+
+    def _count(self, key: str, amount: int = 1):
+        self.state.counter_add('storage', key, amount)
+
+    def _record_saving(self, size: int):
+        self.duplicates += 1
+        self.bytes_saved += size
+        self._count('duplicates')
+        self._count('bytes_saved', size)
+
+    @staticmethod
+    def _place(src: str, dst: str) -> bool:
+        """Atomically make dst a hard link to src, or a copy; True if linked."""
+        with atomic_path(dst) as temp_path:
+            try:
+                os.link(src, temp_path)
+                linked = True
+            except OSError:
+                shutil.copyfile(src, temp_path)
+                linked = False
+        return linked
+
+    def store(self, part_path: str, path: str, digest: str, url: str):
+        """Move a finished download of url into the store and expose it at path.
+
+        If the content is already stored (e.g. fetched from another source),
+        the new bytes are dropped and path links to the existing blob. The part
+        file is only removed once path exists, so readers following the
+        download always find one of the two.
+        """
+        blob = self.blob_path(digest)
+        size = os.path.getsize(part_path)
+        replaced = os.stat(path) if os.path.exists(path) else None
+        while True:
+            try:
+                os.link(part_path, blob)
+            except FileExistsError:
+                # A new download of the same URL is no duplicate, another URL's paper is
+                if any(known != url for known, _ in self.state.paper_names(digest)):
+                    self._record_saving(size)
+            except OSError:
+                # No hard links here: the part file itself becomes the cached paper
+                os.replace(part_path, path)
+                self._count('blobs')
+                self._count('bytes_stored', size)
+                return
+            else:
+                self._count('blobs')
+                self._count('bytes_stored', size)
+
+            try:
+                if not (os.path.exists(path) and os.path.samefile(blob, path)):
+                    self._place(blob, path)
+                break
+            except FileNotFoundError:
+                # Another process just dropped the blob as unlinked: store it again
+                continue
+        os.remove(part_path)
+        if replaced is not None and replaced.st_ino != os.stat(path).st_ino:
+            # path held an older version of the paper
+            self._drop_if_unlinked(replaced)
+
+    def unlink(self, path: str):
+        """Delete path, and the blob it links to once no other path does."""
+        stat = os.stat(path)
+        os.remove(path)
+        self._drop_if_unlinked(stat)
+
+    def _drop_if_unlinked(self, stat: os.stat_result):
+        """Delete the blob of a file, given its stat from before a link to it went away."""
+        # One of the two links it had is the blob: now it is the only one
+        if stat.st_nlink != 2:
+            return
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.inode() == stat.st_ino:
+                    blob = entry.stat(follow_symlinks=False)
+                    if blob.st_dev == stat.st_dev and blob.st_nlink == 1:
+                        os.remove(entry.path)
+                    return
+
+    def link(self, src: str, dst: str):
+        """Put a copy of a stored file at dst, as a hard link when possible.
+
+        The first copy of a paper costs what it did before deduplication; only
+        further paths sharing its blob count as disk saved.
+        """
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            # Already linked, e.g. by an earlier run over the same subject
+            return
+        stat = os.stat(src)
+        # A stored paper is linked from its blob and its download cache entry
+        if self._place(src, dst) and stat.st_nlink > 2:
+            self._record_saving(stat.st_size)
+
+    def discard(self, digest: str, path: str):
+        """Remove the stored file of a digest if path links to it, e.g. once path was damaged."""
+        blob = self.blob_path(digest)
+        if os.path.exists(blob) and os.path.exists(path) and os.path.samefile(blob, path):
+            os.remove(blob)
+
+    def report(self) -> Dict[str, int]:
+        """Return the store's totals across all processes sharing the state."""
+        totals = dict(self.state.counter_top('storage', 10))
+        return {key: totals.get(key, 0)
+                for key in ('blobs', 'bytes_stored', 'duplicates', 'bytes_saved')}
+
+    def summary(self) -> str:
+        """Return a one-line description of what this process deduplicated."""
+        return (f"{self.duplicates} duplicate file(s) linked instead of copied, "
+                f"{self.bytes_saved / (1024 * 1024):.1f} MiB of disk saved")
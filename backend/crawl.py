@@ -0,0 +1,152 @@
+"""
+Crawl helpers shared by the scrapers.
+CrawlContext is passed through one subject crawl: it memoizes recently
+fetched HTML and parsed soups by URL so a page needed twice is only fetched
+(and parsed) once, counts upstream requests against an optional budget, and
+records whether every page could be fetched (a complete crawl). walk_folders
+drives the crawl itself with a fixed pool of workers over a bounded frontier.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from typing import (AsyncIterator, Awaitable, Callable, Hashable, Iterable, List,
+                    Optional, Tuple)
+
+from bs4 import BeautifulSoup
+
+try:
+    from backend.metrics import span
+except ImportError:
+    from metrics import span
+
+
+class CrawlContext:
+    """State scoped to one subject crawl."""
+
+    def __init__(self, max_pages: int = 64, budget: Optional[int] = None):
+        # Only the most recent pages are kept, so memory stays flat on big subjects
+        self.max_pages = max_pages
+        # Upstream requests the crawl may send, or None for no limit
+        self.budget = budget
+        self.pages: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.soups: "OrderedDict[str, Optional[BeautifulSoup]]" = OrderedDict()
+        self.upstream_requests = 0
+        self.memo_hits = 0
+        self.failed_urls: List[str] = []
+
+    @property
+    def complete(self) -> bool:
+        """True when no page of the crawl failed, so its result may be cached."""
+        return not self.failed_urls
+
+    @property
+    def exhausted(self) -> bool:
+        """True once the crawl has sent every upstream request its budget allows."""
+        return self.budget is not None and self.upstream_requests >= self.budget
+
+    def mark_failed(self, url: str):
+        """Record a page that could not be fetched after retries."""
+        self.failed_urls.append(url)
+
+    def _evict(self, memo: OrderedDict):
+        while len(memo) > self.max_pages:
+            oldest = next(iter(memo))
+            if isinstance(memo[oldest], asyncio.Future) and not memo[oldest].done():
+                break
+            memo.popitem(last=False)
+
+    async def page(self, url: str, fetch) -> str:
+        """Return the HTML of url, fetching it with fetch() only the first time.
+
+        Concurrent callers for the same URL share one in-flight request.
+        """
+        if url in self.pages:
+            self.memo_hits += 1
+            self.pages.move_to_end(url)
+            return await asyncio.shield(self.pages[url])
+
+        future = asyncio.ensure_future(fetch())
+        self.pages[url] = future
+        self._evict(self.pages)
+        return await asyncio.shield(future)
+
+    async def soup(self, url: str, fetch) -> Optional[BeautifulSoup]:
+        """Return the parsed page of url, or None if it could not be fetched."""
+        html = await self.page(url, fetch)
+        if url not in self.soups:
+            with span('parse'):
+                self.soups[url] = BeautifulSoup(html, 'html.parser') if html else None
+            self._evict(self.soups)
+        return self.soups[url]
+
+    def summary(self) -> str:
+        """Return a one-line description of the crawl's upstream usage."""
+        return (f"{self.upstream_requests} upstream request(s), "
+                f"{self.memo_hits} duplicate fetch(es) avoided, "
+                f"{len(self.failed_urls)} failed page(s)")
+
+
+# A folder visit returns the records found in it and the sub-folders to visit
+Visit = Callable[[Hashable], Awaitable[Tuple[Iterable, List[Hashable]]]]
+
+
+async def walk_folders(root: Hashable, visit: Visit, workers: int = 5,
+                       max_frontier: int = 100, max_buffered: int = 50) -> AsyncIterator:
+    """Walk a folder tree with a fixed pool of workers, yielding records as found.
+
+    At most `workers` folders are visited at once. Sub-folders wait in a FIFO
+    frontier of at most `max_frontier` entries; beyond that a worker visits
+    the overflow itself, depth first. Found records go through a queue of
+    `max_buffered` entries, so workers pause while the consumer is busy.
+    """
+    # pylint: disable=too-many-locals
+    frontier = deque([root])
+    results: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+    changed = asyncio.Condition()
+    active = 0
+    finished = object()
+
+    async def worker():
+        nonlocal active
+        while True:
+            async with changed:
+                await changed.wait_for(lambda: frontier or not active)
+                if not frontier:
+                    return
+                stack = [frontier.popleft()]
+                active += 1
+            try:
+                while stack:
+                    records, children = await visit(stack.pop())
+                    for record in records:
+                        await results.put(record)
+                    async with changed:
+                        room = max(0, max_frontier - len(frontier))
+                        frontier.extend(children[:room])
+                        stack.extend(reversed(children[room:]))
+                        changed.notify_all()
+            finally:
+                async with changed:
+                    active -= 1
+                    changed.notify_all()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+
+    async def finish():
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await results.put(finished)
+
+    finisher = asyncio.create_task(finish())
+    try:
+        while (record := await results.get()) is not finished:
+            yield record
+        for task in tasks:
+            if not task.cancelled() and task.exception():
+                raise task.exception()
+    finally:
+        # Consumer stopped early (or failed): stop crawling
+        finisher.cancel()
+        for task in tasks:
+            task.cancel()
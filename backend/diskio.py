@@ -0,0 +1,100 @@
+"""
+Disk I/O off the event loop.
+A write to a slow or network disk blocks whichever thread issues it, and when
+that is the event loop every user of the worker waits. DiskIO runs file work
+on its own small thread pool, so disk latency cannot starve the pool asyncio
+uses for DNS and to_thread calls, and BufferedFileWriter batches a download's
+small network chunks into large writes so each hop to that pool is worth it.
+atomic_path() is how files other processes may be reading are replaced.
+"""
+import os
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+# When written files are forced to stable storage
+FSYNC_POLICIES = ('never', 'close', 'always')
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """Yield a temporary path to fill; it replaces path once the block succeeds.
+
+    Readers of path see the old file or the new one, never a partial one.
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class DiskIO:
+    """Thread pool and settings for the file work of one process."""
+
+    def __init__(self, threads: int = 4, chunk_size: int = 256 * 1024, fsync: str = 'never'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {', '.join(FSYNC_POLICIES)}")
+        self.chunk_size = chunk_size
+        self.fsync = fsync
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='disk-io')
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Run a blocking file operation on the disk thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def open_writer(self, path: str) -> 'BufferedFileWriter':
+        """Open a file for writing, truncating it."""
+        return BufferedFileWriter(self, await self.run(open, path, 'wb'))
+
+
+class BufferedFileWriter:
+    """Collects small writes in memory and hands them to the disk pool in chunks."""
+
+    def __init__(self, disk: DiskIO, file):
+        self._disk = disk
+        self._file = file
+        self._buffer = bytearray()
+
+    def _write_out(self, data: bytes, sync: bool):
+        self._file.write(data)
+        # Readers following the file see the bytes once they leave Python's buffer
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    async def write(self, data: bytes) -> int:
+        """Buffer data; return how many bytes reached the file, 0 while buffering."""
+        self._buffer += data
+        if len(self._buffer) < self._disk.chunk_size:
+            return 0
+        return await self.flush()
+
+    async def flush(self) -> int:
+        """Write out whatever is buffered and return its size."""
+        if not self._buffer:
+            return 0
+        data, self._buffer = bytes(self._buffer), bytearray()
+        await self._disk.run(self._write_out, data, self._disk.fsync == 'always')
+        return len(data)
+
+    async def close(self) -> int:
+        """Write out the rest, sync if the policy asks and close; return the rest's size."""
+        try:
+            written = await self.flush()
+            if self._disk.fsync == 'close':
+                await self._disk.run(os.fsync, self._file.fileno())
+        finally:
+            await self._disk.run(self._file.close)
+        return written
+
+    async def abort(self):
+        """Close the file without writing out the buffer, e.g. after a failed download."""
+        self._buffer = bytearray()
+        await self._disk.run(self._file.close)
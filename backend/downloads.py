@@ -0,0 +1,127 @@
+"""
+In-flight paper downloads that readers can follow while they are cached.
+The upstream body is written into `<path>.part` by one task; any number of
+readers stream the bytes written so far and wait for more, so /download can
+serve a paper while it is still arriving and concurrent requesters for the
+same paper share a single upstream transfer.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+try:
+    from backend.diskio import DiskIO
+    from backend.scheduler import QueueFull
+except ImportError:
+    from diskio import DiskIO
+    from scheduler import QueueFull
+
+
+def paper_validators(headers) -> Dict[str, str]:
+    """Return the ETag and Last-Modified of a paper response, those it has."""
+    validators = {'etag': headers.get('ETag', ''),
+                  'last_modified': headers.get('Last-Modified', '')}
+    return {key: value for key, value in validators.items() if value}
+
+
+class InFlightDownload:
+    """A paper being downloaded into the local cache."""
+    # pylint: disable=too-many-instance-attributes
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, path: str, disk: DiskIO):
+        self.path = path
+        self.disk = disk
+        self.part_path = f"{path}.part"
+        self.size: Optional[int] = None
+        self.written = 0
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        # ETag / Last-Modified of the requested URL, unless another mirror answered
+        self.validators: Dict[str, str] = {}
+        self.task: Optional[asyncio.Task] = None
+        self._started = asyncio.Event()
+        self._progress = asyncio.Condition()
+
+    async def _notify(self):
+        async with self._progress:
+            self._progress.notify_all()
+
+    async def start(self, size: Optional[int]):
+        """Mark the upstream response as accepted, with its size when known."""
+        self.size = size
+        self._started.set()
+
+    async def wrote(self, count: int):
+        """Record that count more bytes were written out to the part file."""
+        self.written += count
+        await self._notify()
+
+    async def finish(self):
+        """Mark the download complete; the file now lives at self.path."""
+        self.finished = True
+        self._started.set()
+        await self._notify()
+
+    async def fail(self, error: BaseException):
+        """Mark the download failed and wake all readers."""
+        self.error = error
+        self._started.set()
+        await self._notify()
+
+    def _raise_error(self):
+        """Raise the download's failure, if any, to a waiting requester."""
+        if self.error is None:
+            return
+        if isinstance(self.error, QueueFull):
+            # Refused before anything was sent upstream: the caller may retry later
+            raise self.error
+        raise RuntimeError(f"Download failed: {self.error}") from self.error
+
+    async def wait_started(self):
+        """Wait until the download either started streaming or failed."""
+        await self._started.wait()
+        self._raise_error()
+
+    async def wait(self) -> str:
+        """Wait for the download to complete and return its cached path."""
+        async with self._progress:
+            await self._progress.wait_for(lambda: self.finished or self.error is not None)
+        self._raise_error()
+        return self.path
+
+    def _read(self, offset: int) -> bytes:
+        """Read the next block at offset from the part file or the final file."""
+        for candidate in (self.part_path, self.path):
+            try:
+                with open(candidate, 'rb') as f:
+                    f.seek(offset)
+                    return f.read(self.READ_SIZE)
+            except FileNotFoundError:
+                # The part file was just renamed to its final path
+                continue
+        return b""
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Yield the paper's bytes from the start, following the writer."""
+        offset = 0
+        while True:
+            if offset < self.written or self.finished:
+                chunk = await self.disk.run(self._read, offset)
+                if chunk:
+                    offset += len(chunk)
+                    yield chunk
+                    if offset == self.size:
+                        # Every byte is sent; no need to wait for the cache file to be synced
+                        return
+                    continue
+                if self.finished:
+                    return
+
+            async with self._progress:
+                await self._progress.wait_for(
+                    lambda: (self.written > offset or self.finished
+                             or self.error is not None)
+                )
+            if self.error is not None and not self.finished:
+                raise RuntimeError(f"Download failed: {self.error}") from self.error
@@ -0,0 +1,117 @@
+"""
+Production serving of the built frontend.
+`npm run build` writes the dashboard to frontend/dist, with content-hashed
+file names under assets/. precompress() stores brotli and gzip variants next
+to each text file once, at build time, and FrontendFiles serves the variant
+the browser accepts, letting hashed assets be cached forever while index.html
+is revalidated on every load so a new build is picked up at once.
+"""
+import os
+import gzip
+import argparse
+import mimetypes
+from typing import Tuple
+
+import brotli
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    from backend.diskio import atomic_path
+except ImportError:
+    from diskio import atomic_path
+
+# Content encoding -> suffix of the precompressed variant, in order of preference
+ENCODINGS: Tuple[Tuple[str, str], ...] = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = ('.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.map', '.xml',
+                '.ico', '.webmanifest')
+# Smaller files do not fill a packet even uncompressed
+MIN_SIZE = 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _compress(encoding: str, data: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # A fixed mtime keeps the output identical across rebuilds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory: str) -> int:
+    """Write missing or outdated .br/.gz variants of a build's text files; return how many."""
+    written = 0
+    for parent, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(parent, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < MIN_SIZE:
+                continue
+            mtime = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for encoding, suffix in ENCODINGS:
+                variant = path + suffix
+                if os.path.exists(variant) and os.path.getmtime(variant) >= mtime:
+                    continue
+                compressed = _compress(encoding, data)
+                if len(compressed) >= len(data):
+                    continue
+                # A server running from this build never sends a truncated variant
+                with atomic_path(variant) as temp_path:
+                    with open(temp_path, 'wb') as f:
+                        f.write(compressed)
+                written += 1
+    return written
+
+
+class FrontendFiles(StaticFiles):
+    """StaticFiles for a Vite build: precompressed variants and cache headers."""
+
+    def __init__(self, directory: str):
+        super().__init__(directory=directory, html=True)
+        self.assets_dir = os.path.join(os.path.realpath(directory), 'assets')
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        """Serve the smallest variant the client accepts, with caching headers."""
+        request_headers = Headers(scope=scope)
+        accepted = {token.split(';')[0].strip()
+                    for token in request_headers.get('accept-encoding', '').split(',')}
+        full_path = str(full_path)
+        headers = {'Vary': 'Accept-Encoding'} if full_path.endswith(COMPRESSIBLE) else {}
+        # Hashed names change with their content; everything else may change in place
+        if full_path.startswith(self.assets_dir + os.sep):
+            headers['Cache-Control'] = IMMUTABLE
+        else:
+            headers['Cache-Control'] = 'no-cache'
+
+        serve_path = full_path
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(full_path + suffix):
+                serve_path = full_path + suffix
+                stat_result = os.stat(serve_path)
+                headers['Content-Encoding'] = encoding
+                break
+
+        # The media type is the original file's, not that of its .br/.gz name
+        media_type = mimetypes.guess_type(full_path)[0] or 'text/plain'
+        response = FileResponse(serve_path, status_code=status_code, stat_result=stat_result,
+                                headers=headers, media_type=media_type)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    """Precompress a frontend build."""
+    parser = argparse.ArgumentParser(
+        description="Write brotli and gzip variants of a frontend build's text files.")
+    parser.add_argument("directory", nargs="?", default=os.path.join("frontend", "dist"),
+                        help="build directory (default: frontend/dist)")
+    directory = parser.parse_args().directory
+    print(f"Precompressed {precompress(directory)} file variant(s) in {directory}")
+
+
+if __name__ == "__main__":
+    main()
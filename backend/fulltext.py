@@ -0,0 +1,205 @@
+"""
+Full-text search over downloaded papers.
+Page text is extracted with pypdf in a process pool and stored in a SQLite
+FTS5 index next to the blob store. Blobs are named by content hash, so each
+pass only extracts files that are new or whose size or mtime changed. Hits are
+grouped per paper, named after the URLs and filenames it was downloaded as.
+"""
+import os
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from pypdf import PdfReader
+
+try:
+    from backend.shared_state import StateStore
+except ImportError:
+    from shared_state import StateStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join('temp_downloads', 'examquest_fulltext.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    page_count INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5 (
+    text, document UNINDEXED, page UNINDEXED, tokenize = 'porter unicode61'
+);
+"""
+
+# (digest, path, size, mtime_ns) of a blob that needs indexing
+PendingFile = Tuple[str, str, int, int]
+
+
+def extract_pdf_pages(path: str) -> List[str]:
+    """Return the text of every page of a PDF, or [] if it cannot be read.
+
+    The indexer sends it to its extraction processes, which need a
+    module-level function they can import by name.
+    """
+    try:
+        reader = PdfReader(path)
+        return [page.extract_text() or '' for page in reader.pages]
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # Broken or encrypted PDFs are indexed as empty, so they are not retried
+        logger.warning("Could not extract text from %s: %s", path, e)
+        return []
+
+
+class FullTextIndex:
+    """Incremental FTS5 index of the papers in the blob store."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, state: StateStore, blob_root: str, path: str = DEFAULT_INDEX_PATH,
+                 processes: int = 2, interval: float = 300):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.state = state
+        self.blob_root = blob_root
+        self.processes = processes
+        self.interval = interval
+        self._owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.abspath(path), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            self._conn.executescript(_SCHEMA)
+            self.available = True
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 still run the rest of the backend
+            logger.warning("Full-text search disabled: %s", e)
+            self.available = False
+
+    def _execute(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def pending(self) -> Tuple[List[PendingFile], List[str]]:
+        """Return the blobs to (re)index and the digests of deleted blobs."""
+        indexed = {digest: (size, mtime) for digest, size, mtime in
+                   self._execute('SELECT digest, size, mtime FROM documents')}
+        changed, seen = [], set()
+        with os.scandir(self.blob_root) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith('.pdf'):
+                    continue
+                digest = entry.name[:-len('.pdf')]
+                stat = entry.stat()
+                seen.add(digest)
+                if indexed.get(digest) != (stat.st_size, stat.st_mtime_ns):
+                    changed.append((digest, entry.path, stat.st_size, stat.st_mtime_ns))
+        removed = [digest for digest in indexed if digest not in seen]
+        return changed, removed
+
+    def _store(self, pending: PendingFile, texts: List[str]):
+        """Replace the indexed pages of one blob."""
+        digest, _, size, mtime = pending
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('DELETE FROM pages WHERE document IN '
+                                   '(SELECT id FROM documents WHERE digest = ?)', (digest,))
+                self._conn.execute(
+                    'INSERT INTO documents (digest, size, mtime, page_count) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (digest) DO UPDATE SET size = excluded.size, '
+                    'mtime = excluded.mtime, page_count = excluded.page_count',
+                    (digest, size, mtime, len(texts))
+                )
+                document = self._conn.execute('SELECT id FROM documents WHERE digest = ?',
+                                              (digest,)).fetchone()[0]
+                self._conn.executemany(
+                    'INSERT INTO pages (text, document, page) VALUES (?, ?, ?)',
+                    [(text, document, number)
+                     for number, text in enumerate(texts, start=1) if text.strip()]
+                )
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _remove(self, digests: List[str]):
+        """Drop blobs that no longer exist from the index."""
+        for digest in digests:
+            self._execute('DELETE FROM pages WHERE document IN '
+                          '(SELECT id FROM documents WHERE digest = ?)', (digest,))
+            self._execute('DELETE FROM documents WHERE digest = ?', (digest,))
+
+    async def refresh(self, pool: ProcessPoolExecutor) -> int:
+        """Index new and changed blobs; return how many were (re)indexed."""
+        changed, removed = await asyncio.to_thread(self.pending)
+        if removed:
+            await asyncio.to_thread(self._remove, removed)
+
+        loop = asyncio.get_running_loop()
+        # Only a few files are queued at once, so a big backlog stays cancellable
+        limit = asyncio.Semaphore(self.processes * 2)
+
+        async def index(pending: PendingFile):
+            async with limit:
+                texts = await loop.run_in_executor(pool, extract_pdf_pages, pending[1])
+            await asyncio.to_thread(self._store, pending, texts)
+            # Long backlogs outlive one lease, so keep renewing it
+            await asyncio.to_thread(self.state.try_lock, 'fulltext:indexer', self._owner,
+                                    self.interval * 3)
+
+        await asyncio.gather(*(index(pending) for pending in changed))
+        return len(changed)
+
+    async def run(self):
+        """Keep the index up to date every interval until the task is cancelled."""
+        pool = ProcessPoolExecutor(max_workers=self.processes)
+        try:
+            while True:
+                # Only one worker process indexes; the others read the same database
+                if await asyncio.to_thread(self.state.try_lock, 'fulltext:indexer',
+                                           self._owner, self.interval * 3):
+                    try:
+                        indexed = await self.refresh(pool)
+                        if indexed:
+                            logger.info("Full-text index updated with %d paper(s)", indexed)
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        logger.error("Full-text indexing failed: %s", e, exc_info=True)
+                await asyncio.sleep(self.interval)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def search(self, query: str, limit: int = 50) -> List[dict]:
+        """Return at most limit papers whose pages match every word of query, best first.
+
+        A paper ranks by its best matching page and lists all its matching pages.
+        """
+        # Quote each word so user input is never parsed as FTS5 query syntax
+        terms = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+        if not terms:
+            return []
+        rows = self._execute(
+            "WITH best AS (SELECT document, MIN(rank) AS score FROM pages "
+            "WHERE pages MATCH ? GROUP BY document ORDER BY score LIMIT ?) "
+            "SELECT documents.digest, pages.page, snippet(pages, 0, '[', ']', '...', 16) "
+            "FROM pages JOIN best ON best.document = pages.document "
+            "JOIN documents ON documents.id = pages.document "
+            "WHERE pages MATCH ? ORDER BY best.score, pages.rank",
+            (terms, limit, terms)
+        )
+
+        results: Dict[str, dict] = {}
+        for digest, page, snippet in rows:
+            if digest not in results:
+                results[digest] = {
+                    'papers': [{'name': name, 'url': url}
+                               for url, name in self.state.paper_names(digest)],
+                    'pages': [],
+                }
+            results[digest]['pages'].append({'page': page, 'snippet': snippet})
+        return list(results.values())
@@ -0,0 +1,120 @@
+"""
+Hedged paper downloads across the mirrors of one paper.
+A download asks the mirror expected to answer first. When that request fails,
+or is slower than the mirror's usual latency percentile, the next mirror is
+asked too; whichever answers first wins and the other request is cancelled.
+Every request in flight holds an upstream slot of its own, so a hedge is only
+sent while a slot is free and never takes upstream concurrency past its limit.
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+try:
+    from backend.mirrors import MirrorStats
+except ImportError:
+    from mirrors import MirrorStats
+
+# Opens one mirror's response, raising if it does not answer with the paper
+OpenMirror = Callable[[aiohttp.ClientSession, str], Awaitable[aiohttp.ClientResponse]]
+
+
+class HedgedOpener:
+    """Open a paper's response from the first of its mirrors to answer."""
+
+    def __init__(self, open_mirror: OpenMirror, take_slot: Callable[[bool], Awaitable[str]],
+                 release_slot: Callable[[str], Awaitable[None]], stats: MirrorStats):
+        self.open_mirror = open_mirror
+        # take_slot(wait) returns the owner of an upstream slot, "" if none is free
+        self.take_slot = take_slot
+        self.release_slot = release_slot
+        self.stats = stats
+
+    async def _open_leg(self, session: aiohttp.ClientSession, url: str,
+                        owner: str = "") -> Tuple[aiohttp.ClientResponse, str, str]:
+        """Open one mirror in a slot of its own, taken now unless owner already holds one."""
+        owner = owner or await self.take_slot(True)
+        try:
+            return await self.open_mirror(session, url), url, owner
+        except BaseException:
+            await self.release_slot(owner)
+            raise
+
+    async def close(self, response: aiohttp.ClientResponse, owner: str):
+        """Close a mirror's response and give back its upstream slot."""
+        response.release()
+        await self.release_slot(owner)
+
+    async def open(self, session: aiohttp.ClientSession, candidates: List[str],
+                   filename: str) -> Tuple[aiohttp.ClientResponse, str, str]:
+        """Race at most two mirrors; return the first response, its URL and its slot's owner.
+
+        The caller closes the response with close() once it has read it.
+        """
+        remaining = list(candidates)
+        # Request in flight -> host of its mirror
+        pending = {}
+        errors = []
+        hedging = True
+
+        def launch(owner: str = ""):
+            next_url = remaining.pop(0)
+            task = asyncio.create_task(self._open_leg(session, next_url, owner))
+            pending[task] = urlparse(next_url).netloc
+
+        launch()
+        try:
+            while pending:
+                # Only hedge while a single request is in flight and a mirror is left
+                timeout = None
+                if hedging and remaining and len(pending) == 1:
+                    timeout = self.stats.hedge_delay(next(iter(pending.values())))
+
+                done, _ = await asyncio.wait(pending, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    owner = await self.take_slot(False)
+                    if owner:
+                        launch(owner)
+                    else:
+                        # Every slot is taken: keep waiting instead of queueing a hedge
+                        hedging = False
+                    continue
+
+                for task in done:
+                    pending.pop(task)
+                winner = await self._pick_winner(done, errors)
+                if winner is not None:
+                    return winner.result()
+                if remaining and not pending:
+                    launch()
+        finally:
+            await self._cancel(pending)
+
+        reason = errors[-1] if errors else 'no mirror available'
+        raise RuntimeError(f"Failed to download {filename}: {reason}")
+
+    async def _cancel(self, pending):
+        """Cancel the losing requests and close those that completed meanwhile."""
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, tuple):
+                await self.close(result[0], result[-1])
+
+    async def _pick_winner(self, done, errors: list) -> Optional[asyncio.Task]:
+        """Return the first successful attempt among finished ones."""
+        winner = None
+        for task in done:
+            try:
+                response, _, owner = task.result()
+            except (RuntimeError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                errors.append(e)
+                continue
+            if winner is None:
+                winner = task
+            else:
+                await self.close(response, owner)
+        return winner
@@ -6,19 +6,44 @@ Updated for asynchronous operations and aiohttp session management.
 import os
 import json
 import uuid
+import hashlib
+import asyncio
 import logging
+from collections import deque
 from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
 
 import aiohttp
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 
 try:
-    from backend.scraper_service import ExamScraperService
+    from backend.crawl import CrawlContext
+    from backend.diskio import DiskIO
+    from backend.frontend import FrontendFiles
+    from backend.fulltext import FullTextIndex
+    from backend.metrics import (LoopLagMonitor, RequestProfiler, span, start_timings,
+                                 stop_timings)
+    from backend.offline import OfflineMirror
+    from backend.pdfmerge import estimate_merge_memory
+    from backend.scheduler import FairScheduler, Priority, QueueFull, work_context
+    from backend.scraper_service import ExamScraperService, merge_pdf_files
+    from backend.warmer import CacheWarmer
 except ImportError:
-    from scraper_service import ExamScraperService
+    from crawl import CrawlContext
+    from diskio import DiskIO
+    from frontend import FrontendFiles
+    from fulltext import FullTextIndex
+    from metrics import LoopLagMonitor, RequestProfiler, span, start_timings, stop_timings
+    from offline import OfflineMirror
+    from pdfmerge import estimate_merge_memory
+    from scheduler import FairScheduler, Priority, QueueFull, work_context
+    from scraper_service import ExamScraperService, merge_pdf_files
+    from warmer import CacheWarmer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,10 +51,26 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(fastapi_app: FastAPI):
-    """Manage the lifecycle of the aiohttp ClientSession."""
+    """Manage the aiohttp ClientSession and the background warmer and indexer."""
     async with aiohttp.ClientSession() as session:
         fastapi_app.state.session = session
-        yield
+        # CPU-bound merging runs on other cores instead of this worker's event loop
+        fastapi_app.state.process_pool = ProcessPoolExecutor(max_workers=MERGE_PROCESSES)
+        if offline:
+            await asyncio.to_thread(offline.load)
+        background = [asyncio.create_task(loop_monitor.run()),
+                      asyncio.create_task(warmer.flush_periodically())]
+        if WARMER_ENABLED:
+            background.append(asyncio.create_task(warmer.run(session)))
+        if INDEX_ENABLED and fulltext.available:
+            background.append(asyncio.create_task(fulltext.run()))
+        try:
+            yield
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            fastapi_app.state.process_pool.shutdown(wait=False, cancel_futures=True)
 
 app = FastAPI(title="Exam Paper Downloader API", lifespan=lifespan)
 
@@ -40,29 +81,278 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Crawl-Complete", "Server-Timing", "X-Profile-Id"],
 )
 
-service = ExamScraperService()
+# The upstream limit is global: it is shared by every worker process
+UPSTREAM_CONCURRENCY = int(os.environ.get("EXAMQUEST_UPSTREAM_CONCURRENCY", "5"))
+service = ExamScraperService(
+    concurrency=UPSTREAM_CONCURRENCY,
+    jitter=(float(os.environ.get("EXAMQUEST_JITTER_MIN", "0.5")),
+            float(os.environ.get("EXAMQUEST_JITTER_MAX", "2.0"))),
+    upstream_override=os.environ.get("EXAMQUEST_UPSTREAM_OVERRIDE", ""),
+    scheduler=FairScheduler(
+        UPSTREAM_CONCURRENCY,
+        max_queue=int(os.environ.get("EXAMQUEST_MAX_QUEUE", "100")),
+        max_per_client=int(os.environ.get("EXAMQUEST_MAX_QUEUE_PER_CLIENT", "20")),
+    ),
+    disk=DiskIO(
+        threads=int(os.environ.get("EXAMQUEST_DISK_THREADS", "4")),
+        chunk_size=int(os.environ.get("EXAMQUEST_WRITE_CHUNK_KB", "256")) * 1024,
+        fsync=os.environ.get("EXAMQUEST_FSYNC", "never"),
+    ),
+)
 CACHE_FILE = "subject_cache.json"
+# Paper listings change when new sessions are published, so they expire
+PAPERS_CACHE_TTL = float(os.environ.get("EXAMQUEST_PAPERS_TTL", "21600"))
+MERGE_PROCESSES = int(os.environ.get("EXAMQUEST_MERGE_PROCESSES", "2"))
+# Estimated peak memory a single merge may use; bigger bundles are streamed or refused
+MERGE_MEMORY_CAP = int(os.environ.get("EXAMQUEST_MERGE_MEMORY_MB", "512")) * 1024 * 1024
+
+# Subjects cached by older versions in a JSON file move to the shared store
+service.state.import_json_cache(CACHE_FILE)
+
+# Event-loop lag of this worker, reported by /metrics
+loop_monitor = LoopLagMonitor()
+# Size, mode and peak RSS of this worker's latest merges, reported by /metrics
+recent_merges = deque(maxlen=50)
+
+# Requests slower than this are logged with their phase timings (0 logs every request)
+SLOW_REQUEST_MS = float(os.environ.get("EXAMQUEST_SLOW_REQUEST_MS", "1000"))
+# Opt-in: "?profile=1" or "X-Profile: 1" captures a cProfile of that request
+PROFILING_ENABLED = os.environ.get("EXAMQUEST_PROFILING", "0") == "1"
+profiler = RequestProfiler(os.path.abspath(os.path.join("temp_downloads", "profiles")))
+
+def papers_cache_key(source: str, board: str, subject_url: str) -> str:
+    """Return the cache key of a subject's paper listing."""
+    return f"papers_{source}_{board}_{subject_url}"
+
+async def get_cached_papers(key: str):
+    """Return a cached paper listing if it has not expired yet."""
+    return await asyncio.to_thread(service.state.cache_get, key, PAPERS_CACHE_TTL)
+
+async def crawl_papers(session: aiohttp.ClientSession, subject_url: str,
+                       board: str, source: str, ctx: Optional[CrawlContext] = None):
+    """Crawl and categorize the paper listing of a subject.
+
+    Returns (papers, complete); only complete listings are cached.
+    """
+    ctx = ctx or CrawlContext()
+    papers = await service.get_pdfs(session, subject_url, board, source, ctx)
+    categorized = categorize_papers(papers, board)
+    await store_listing(source, board, subject_url, categorized, ctx.complete)
+    return categorized, ctx.complete
+
+def categorize_papers(papers: dict, board: str) -> list:
+    """Turn a {filename: url} listing into categorized paper records."""
+    with span("categorize"):
+        return [
+            {
+                "name": filename,
+                "url": url,
+                "type": service.categorize_pdf(filename, board)
+            }
+            for filename, url in papers.items()
+        ]
+
+async def store_listing(source: str, board: str, subject_url: str,
+                        categorized: list, complete: bool):
+    """Cache a paper listing, unless it is empty or partial."""
+    if categorized and complete:
+        await asyncio.to_thread(service.state.cache_set,
+                                papers_cache_key(source, board, subject_url), categorized)
+
+async def warm_listing(session: aiohttp.ClientSession, source: str,
+                       board: str, subject_url: str, ctx: CrawlContext) -> bool:
+    """Crawl a subject listing for the warmer, within ctx's budget, unless it is still fresh.
+
+    A crawl cut short by the budget is incomplete, so it is not cached.
+    """
+    key = papers_cache_key(source, board, subject_url)
+    if await get_cached_papers(key) is not None:
+        return False
+    categorized, complete = await crawl_papers(session, subject_url, board, source, ctx)
+    return bool(categorized) and complete
+
+# Serve a local paper tree (e.g. one the CLI downloaded) instead of scraping live sources
+OFFLINE_MIRROR = os.environ.get("EXAMQUEST_OFFLINE_MIRROR", "")
+offline = OfflineMirror(OFFLINE_MIRROR) if OFFLINE_MIRROR else None
+
+def offline_merge_input(url: str) -> str:
+    """Link a mirror paper into temp_downloads, where merges read their inputs."""
+    source_path = offline.paper_path(url)
+    if not source_path:
+        return ""
+    url_hash = hashlib.sha256(url.encode()).hexdigest()
+    path = service.get_safe_path(f"offline_{url_hash}.pdf")
+    service.blobs.link(source_path, path)
+    return path
+
+# An offline mirror has nothing upstream to warm
+WARMER_ENABLED = os.environ.get("EXAMQUEST_WARMER", "1") != "0" and not offline
+warmer = CacheWarmer(
+    service,
+    warm_listing,
+    top_n=int(os.environ.get("EXAMQUEST_WARM_TOP_N", "10")),
+    budget=int(os.environ.get("EXAMQUEST_WARM_BUDGET", "200")),
+    quiet_seconds=float(os.environ.get("EXAMQUEST_WARM_QUIET", "30")),
+    interval=float(os.environ.get("EXAMQUEST_WARM_INTERVAL", "60")),
+    warm_pdfs=int(os.environ.get("EXAMQUEST_WARM_PDFS", "0")),
+)
+
+# Downloaded papers are indexed for /fulltext in the background
+INDEX_ENABLED = os.environ.get("EXAMQUEST_INDEX", "1") != "0"
+fulltext = FullTextIndex(
+    service.state,
+    service.blobs.root,
+    processes=int(os.environ.get("EXAMQUEST_INDEX_PROCESSES", "2")),
+    interval=float(os.environ.get("EXAMQUEST_INDEX_INTERVAL", "300")),
+)
+
+@app.middleware("http")
+async def track_activity(request: Request, call_next):
+    """Let the cache warmer know that users are being served."""
+    warmer.note_activity()
+    return await call_next(request)
 
-def load_cache():
-    """Load the subject cache from a JSON file."""
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-    return {}
-
-def save_cache(cache):
-    """Save the subject cache to a JSON file."""
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f)
+# Endpoints that may send upstream requests, and those of them that yield to the others
+UPSTREAM_PATHS = {"/subjects", "/papers", "/papers/stream", "/papers/batch", "/download",
+                  "/merge"}
+BULK_PATHS = {"/merge", "/papers/batch"}
+# Proxies (e.g. "127.0.0.1") whose X-Forwarded-For names the client
+TRUSTED_PROXIES = {address.strip()
+                   for address in os.environ.get("EXAMQUEST_TRUSTED_PROXIES", "").split(",")
+                   if address.strip()}
+
+def client_key(request: Request) -> str:
+    """Return whom a request's upstream work is queued for: its address, never its claim."""
+    peer = request.client.host if request.client else ""
+    if peer not in TRUSTED_PROXIES:
+        return peer
+    forwarded = [address.strip() for header in request.headers.getlist("X-Forwarded-For")
+                 for address in header.split(",") if address.strip()]
+    # Our proxies append to the right; the first other address is the one they saw
+    for address in reversed(forwarded):
+        if address not in TRUSTED_PROXIES:
+            return address
+    return peer
+
+def too_many_requests(exc: QueueFull) -> JSONResponse:
+    """Answer a refused request with 429 and when to retry."""
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.middleware("http")
+async def schedule_request(request: Request, call_next):
+    """Admit the request, then run its upstream work for its client at its priority class.
+
+    Admission happens before any upstream work and before a streamed response
+    starts, so a saturated worker refuses with 429 instead of failing a crawl
+    halfway through.
+    """
+    client = client_key(request)
+    priority = Priority.BULK if request.url.path in BULK_PATHS else Priority.INTERACTIVE
+    admitted = request.url.path in UPSTREAM_PATHS and not offline
+    if not admitted:
+        with work_context(priority, client):
+            return await call_next(request)
+
+    try:
+        service.scheduler.admit(priority, client)
+    except QueueFull as e:
+        return too_many_requests(e)
+    try:
+        with work_context(priority, client, admitted):
+            response = await call_next(request)
+    except BaseException:
+        service.scheduler.leave(client)
+        raise
+    # The request keeps its place until its (possibly streamed) body is sent
+    response.body_iterator = leave_when_sent(response.body_iterator, client)
+    return response
+
+async def leave_when_sent(body: AsyncIterator, client: str) -> AsyncIterator:
+    """Pass a response body through, then give back its request's scheduler place."""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        service.scheduler.leave(client)
+
+@app.exception_handler(QueueFull)
+async def reject_when_saturated(_request: Request, exc: QueueFull):
+    """Refuse work early instead of queueing it behind an overloaded upstream."""
+    return too_many_requests(exc)
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    """Report where a request's time went in a Server-Timing header and the log.
+
+    Streaming responses are timed until their headers are sent.
+    """
+    timings, token = start_timings()
+    profiling = PROFILING_ENABLED and "1" in (request.query_params.get("profile"),
+                                              request.headers.get("X-Profile"))
+    profiling = profiling and profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        stop_timings(token)
+        profile_id = profiler.finish() if profiling else ""
+
+    response.headers["Server-Timing"] = timings.server_timing()
+    response.headers["Timing-Allow-Origin"] = "*"
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    total_ms = timings.elapsed() * 1000
+    if total_ms >= SLOW_REQUEST_MS:
+        logger.info(json.dumps({
+            "event": "request_timing",
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 1),
+            "phases": timings.as_dict(),
+            "profile_id": profile_id or None,
+        }))
+    return response
+
+@app.get("/health")
+async def health():
+    """Readiness probe used by run_app.py instead of a fixed startup sleep."""
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics(window: float = 60):
+    """Report this worker's event-loop lag over the last `window` seconds and upstream usage."""
+    return {
+        "pid": os.getpid(),
+        "event_loop_lag": loop_monitor.snapshot(window),
+        "upstream_requests": service.upstream_requests,
+        "mirrors": service.mirror_stats.snapshot(),
+        "merges": list(recent_merges),
+    }
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, fmt: str = "pstats"):
+    """Download a captured request profile (pstats), or its top functions as text."""
+    path = profiler.path(profile_id) if PROFILING_ENABLED else ""
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if fmt == "text":
+        return PlainTextResponse(await asyncio.to_thread(profiler.summary, profile_id))
+    return FileResponse(path, filename=f"{profile_id}.pstats")
+
+@app.get("/storage")
+async def storage():
+    """Report how much disk content-hash deduplication of papers has saved."""
+    return await asyncio.to_thread(service.blobs.report)
 
 @app.get("/boards")
 async def get_boards():
     """Return a list of supported examination boards and sources."""
+    if offline:
+        return offline.boards()
     return [
         {
             "id": "xtremepapers_caie",
@@ -87,6 +377,8 @@ async def get_boards():
 @app.get("/levels/{board_id}")
 async def get_levels(board_id: str):
     """Return available levels for a specific board."""
+    if offline:
+        return offline.levels(board_id)
     if "caie" in board_id:
         return ["IGCSE", "O Level", "A Level"]
     return ["International GCSE", "Advanced Level"]
@@ -94,11 +386,16 @@ async def get_levels(board_id: str):
 @app.get("/subjects")
 async def get_subjects(request: Request, source: str, board: str, level: str):
     """Fetch subjects based on source, board, and level."""
-    cache = load_cache()
-    cache_key = f"{source}_{board}_{level}"
+    if offline:
+        subjects = offline.subjects(board, level)
+        if not subjects:
+            raise HTTPException(status_code=404, detail="No subjects found")
+        return subjects
 
-    if cache_key in cache:
-        return cache[cache_key]
+    cache_key = f"{source}_{board}_{level}"
+    cached = await asyncio.to_thread(service.state.cache_get, cache_key)
+    if cached is not None:
+        return cached
 
     session = request.app.state.session
     if source == 'xtremepapers':
@@ -114,52 +411,232 @@ async def get_subjects(request: Request, source: str, board: str, level: str):
     # Transform dict to list for easier frontend consumption
     subject_list = [{"name": name, "url": url} for name, url in subjects.items()]
 
-    cache[cache_key] = subject_list
-    save_cache(cache)
+    await asyncio.to_thread(service.state.cache_set, cache_key, subject_list)
 
     return subject_list
 
+async def load_papers(session: aiohttp.ClientSession, source: str, board: str,
+                      subject_url: str):
+    """Return a subject's categorized papers and whether the listing is complete.
+
+    Listings come from the offline mirror, the cache, or a fresh crawl.
+    """
+    if offline:
+        return offline.papers(subject_url) or [], True
+
+    warmer.record_subject(source, board, subject_url)
+    cached = await get_cached_papers(papers_cache_key(source, board, subject_url))
+    if cached is not None:
+        return cached, True
+    return await crawl_papers(session, subject_url, board, source)
+
 @app.get("/papers")
-async def get_papers(request: Request, subject_url: str, board: str, source: str):
-    """Fetch PDF links for a specific subject."""
-    session = request.app.state.session
-    papers = await service.get_pdfs(session, subject_url, board, source)
-    if not papers:
-        raise HTTPException(status_code=404, detail="No papers found")
+async def get_papers(request: Request, response: Response,
+                     subject_url: str, board: str, source: str):
+    """Fetch PDF links for a specific subject.
 
-    # Categorize papers
-    categorized = []
-    for filename, url in papers.items():
-        type_tag = service.categorize_pdf(filename, board)
-        categorized.append({
-            "name": filename,
-            "url": url,
-            "type": type_tag
-        })
+    The X-Crawl-Complete header is "false" when some folders could not be
+    fetched, so the listing may be missing papers.
+    """
+    categorized, complete = await load_papers(request.app.state.session, source, board,
+                                              subject_url)
+    if not categorized:
+        raise HTTPException(status_code=404, detail="No papers found")
 
+    response.headers["X-Crawl-Complete"] = "true" if complete else "false"
     return categorized
 
+def stream_record(record: dict, fmt: str, event: str = "paper") -> str:
+    """Encode one streamed record as an NDJSON line or an SSE event."""
+    if fmt == "sse":
+        event = "done" if record.get("done") else event
+        return f"event: {event}\ndata: {json.dumps(record)}\n\n"
+    return json.dumps(record) + "\n"
+
+@app.get("/papers/stream")
+async def stream_papers(request: Request, subject_url: str, board: str, source: str,
+                        fmt: str = "ndjson"):
+    """Stream categorized papers as each year/session page is parsed.
+
+    Records are NDJSON lines (or SSE events with fmt=sse). The last record is
+    {"done": true, "complete": ..., "count": ...}.
+    """
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    if offline:
+        cached = offline.papers(subject_url) or []
+    else:
+        warmer.record_subject(source, board, subject_url)
+        cached = await get_cached_papers(papers_cache_key(source, board, subject_url))
+
+    async def cached_body():
+        for record in cached:
+            yield stream_record(record, fmt)
+        yield stream_record({"done": True, "complete": True, "count": len(cached)}, fmt)
+
+    if cached is not None:
+        return StreamingResponse(cached_body(), media_type=media_type)
+
+    ctx = CrawlContext()
+    records = service.iter_pdfs(request.app.state.session, subject_url, board, source, ctx)
+
+    async def crawl_body():
+        papers = {}
+        try:
+            # Each filename comes once: the crawl skips papers it already found
+            async for filename, url in records:
+                papers[filename] = url
+                for record in categorize_papers({filename: url}, board):
+                    yield stream_record(record, fmt)
+
+            await store_listing(source, board, subject_url, categorize_papers(papers, board),
+                                ctx.complete)
+            yield stream_record({"done": True, "complete": ctx.complete, "count": len(papers)},
+                                fmt)
+        finally:
+            # Also reached when the client disconnects: closing the generator stops the crawl
+            await records.aclose()
+
+    return StreamingResponse(crawl_body(), media_type=media_type)
+
+# Subjects one /papers/batch request may list
+MAX_BATCH_SUBJECTS = 50
+# Subjects of one batch crawled at once; their requests also share the upstream limit
+BATCH_CONCURRENCY = 4
+
+async def batch_result(session: aiohttp.ClientSession, limit: asyncio.Semaphore,
+                       subject: tuple) -> dict:
+    """Load one subject of a batch, reporting a failure instead of raising it."""
+    source, board, subject_url = subject
+    result = {"source": source, "board": board, "subject_url": subject_url,
+              "papers": [], "complete": False, "error": None}
+    try:
+        async with limit:
+            result["papers"], result["complete"] = await load_papers(session, source, board,
+                                                                     subject_url)
+        if not result["papers"]:
+            result["error"] = "No papers found"
+    except QueueFull as e:
+        result["error"] = str(e)
+        result["retry_after"] = e.retry_after
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.error("Batch listing of %s failed: %s", subject_url, e, exc_info=True)
+        result["error"] = "An internal error has occurred!"
+    return result
+
+@app.post("/papers/batch")
+async def batch_papers(request: Request, data: dict, fmt: str = "json"):
+    """Fetch the papers of several subjects at once, crawling them concurrently.
+
+    The body is {"subjects": [{"source", "board", "subject_url"}, ...]}. Every
+    subject gets a result with its papers, whether the listing is complete and
+    an error, if any, so one failing subject does not fail the batch. With
+    fmt=ndjson (or sse) results are streamed as subjects finish, followed by
+    {"done": true, "count": ..., "failed": ...}.
+    """
+    subjects = data.get("subjects", [])
+    if not isinstance(subjects, list) or not all(isinstance(s, dict) for s in subjects):
+        raise HTTPException(status_code=400, detail="subjects must be a list of objects")
+    if len(subjects) > MAX_BATCH_SUBJECTS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_BATCH_SUBJECTS} subjects per batch")
+    # A subject listed twice is crawled once
+    unique = list(dict.fromkeys(
+        (str(s.get("source", "")), str(s.get("board", "")), str(s.get("subject_url", "")))
+        for s in subjects
+    ))
+
+    session = request.app.state.session
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    if fmt == "json":
+        results = await asyncio.gather(*(batch_result(session, limit, s) for s in unique))
+        return {"results": results,
+                "failed": sum(1 for result in results if result["error"])}
+
+    async def body():
+        tasks = [asyncio.create_task(batch_result(session, limit, s)) for s in unique]
+        failed = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                failed += bool(result["error"])
+                yield stream_record(result, fmt, event="subject")
+            yield stream_record({"done": True, "count": len(tasks), "failed": failed}, fmt)
+        finally:
+            # A disconnected client cancels the subjects still being crawled for it
+            for task in tasks:
+                task.cancel()
+
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
+
+@app.post("/favorites")
+async def report_favorites(data: dict):
+    """Receive a frontend's favorite subjects so the warmer can prefetch them."""
+    favorites = data.get("favorites", [])
+    if not isinstance(favorites, list):
+        raise HTTPException(status_code=400, detail="favorites must be a list")
+    warmer.record_favorites([f for f in favorites if isinstance(f, dict)])
+    return {"received": len(favorites)}
+
+def attachment_headers(filename: str) -> dict:
+    """Return a Content-Disposition header naming the attachment like FileResponse does."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+@app.get("/fulltext")
+async def full_text_search(q: str, limit: int = 50):
+    """Search the text of downloaded papers; hits are grouped by paper with their pages."""
+    if not fulltext.available:
+        raise HTTPException(status_code=503, detail="Full-text search is unavailable")
+    return await asyncio.to_thread(fulltext.search, q, max(1, min(limit, 200)))
+
 @app.get("/download")
 async def download_file(request: Request, url: str, filename: str):
-    """Download a specific paper."""
+    """Download a specific paper, streaming it while it is fetched into the cache."""
+    if offline:
+        path = offline.paper_path(url)
+        if not path:
+            raise HTTPException(status_code=404, detail="Paper not found")
+        return FileResponse(path, filename=os.path.basename(filename))
+
     # Strict reconstruction from constant prefix
     safe_url = service._get_safe_url(url) # pylint: disable=protected-access
     if not safe_url:
         raise HTTPException(status_code=400, detail="Untrusted URL")
 
+    warmer.record_download(safe_url, filename)
+    # Use only sanitized basename for attachment
+    attachment_name = os.path.basename(filename)
+    cached = service.cached_paper_path(safe_url)
+    if cached:
+        return FileResponse(cached, filename=attachment_name)
+
     session = request.app.state.session
     try:
-        # download_paper returns a safe path derived from a hash
-        path = await service.download_paper(session, safe_url, filename)
-        # Use only sanitized basename for attachment
-        return FileResponse(path, filename=os.path.basename(filename))
+        # Concurrent requesters for the same paper follow the same upstream transfer
+        download = service.start_download(session, safe_url)
+        await download.wait_started()
+    except QueueFull:
+        raise
     except Exception as e:  # pylint: disable=broad-exception-caught
         logger.error("Download failed: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error") from e
 
+    headers = attachment_headers(attachment_name)
+    if download.size is not None:
+        headers["Content-Length"] = str(download.size)
+    return StreamingResponse(download.iter_chunks(), media_type="application/pdf",
+                             headers=headers)
+
 @app.post("/merge")
 async def merge_papers(request: Request, data: dict):
-    """Merge multiple papers into a single PDF."""
+    """Merge multiple papers into a single PDF.
+
+    Bundles whose in-memory merge would exceed the memory cap are streamed
+    (without bookmarks); bundles too big even for that are refused with 413.
+    """
     session = request.app.state.session
     try:
         papers = data.get("papers", [])
@@ -167,23 +644,48 @@ async def merge_papers(request: Request, data: dict):
         opaque_output_name = f"merged_{uuid.uuid4().hex}.pdf"
         safe_output_path = service.get_safe_path(opaque_output_name)
 
-        downloaded_paths = []
+        downloaded_paths, sizes = [], []
         for p in papers:
             p_url = p.get("url", "")
-            safe_p_url = service._get_safe_url(p_url) # pylint: disable=protected-access
-            if not safe_p_url:
-                continue
-            path = await service.download_paper(session, safe_p_url, p.get("name", "paper.pdf"))
+            if offline:
+                path = await asyncio.to_thread(offline_merge_input, p_url)
+                if not path:
+                    continue
+            else:
+                safe_p_url = service._get_safe_url(p_url) # pylint: disable=protected-access
+                if not safe_p_url:
+                    continue
+                path = await service.download_paper(session, safe_p_url)
             downloaded_paths.append(path)
+            sizes.append(os.path.getsize(path))
+            # Refuse as soon as the bundle is known to be too big, before fetching the rest
+            if estimate_merge_memory(sizes, streaming=True) > MERGE_MEMORY_CAP:
+                raise HTTPException(status_code=413,
+                                    detail="Papers too large to merge within the memory limit")
 
         if not downloaded_paths:
             raise HTTPException(status_code=400, detail="No valid papers to merge")
 
-        service.merge_pdfs(downloaded_paths, safe_output_path)
+        streaming = estimate_merge_memory(sizes, streaming=False) > MERGE_MEMORY_CAP
+        with span("merge"):
+            stats = await asyncio.get_running_loop().run_in_executor(
+                request.app.state.process_pool, merge_pdf_files, downloaded_paths,
+                safe_output_path, streaming
+            )
+        recent_merges.append(stats)
+        logger.info(json.dumps({"event": "merge", **stats}))
         return FileResponse(safe_output_path, filename="merged_papers.pdf")
+    except (HTTPException, QueueFull):
+        raise
     except Exception as e:  # pylint: disable=broad-exception-caught
         logger.error("Merge failed: %s", e, exc_info=True)
         return JSONResponse(status_code=500, content={"error": "An internal error has occurred!"})
 
+# In production the built dashboard is served from here too; mounted last so that
+# every API route above takes precedence over a file of the same name
+FRONTEND_DIST = os.environ.get("EXAMQUEST_FRONTEND_DIST", "")
+if FRONTEND_DIST:
+    app.mount("/", FrontendFiles(FRONTEND_DIST), name="frontend")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,67 @@
+"""
+Sync manifests of the CLI's subject trees.
+Each subject directory keeps a record of the papers synced into it: their
+URL, size, sha256 and the ETag / Last-Modified upstream sent, so a later run
+can check papers with a conditional HEAD, or not at all, instead of
+downloading every PDF again.
+"""
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Optional
+
+try:
+    from backend.diskio import atomic_path
+except ImportError:
+    from diskio import atomic_path
+
+MANIFEST_NAME = '.examquest_manifest.json'
+
+
+def file_sha256(path: str) -> str:
+    """Return the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SyncManifest:
+    """The papers synced into one subject directory, by file name."""
+
+    def __init__(self, subject_dir: str):
+        self.subject_dir = subject_dir
+        self.path = os.path.join(subject_dir, MANIFEST_NAME)
+        self.papers: Dict[str, dict] = {}
+
+    def load(self):
+        """Read the manifest, if the subject was synced before."""
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.papers = json.load(f).get('papers', {})
+
+    def save(self):
+        """Write the manifest atomically."""
+        # An interrupted run leaves the previous manifest, never half of one
+        with atomic_path(self.path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'papers': self.papers}, f, indent=1, sort_keys=True)
+
+    def local_path(self, filename: str) -> Optional[str]:
+        """Return where a recorded paper is saved, or None if it is not recorded."""
+        entry = self.papers.get(filename)
+        return os.path.join(self.subject_dir, entry['path']) if entry else None
+
+    def record(self, filename: str, url: str, path: str, validators: Dict[str, str]):
+        """Record a paper saved at path (inside the subject directory)."""
+        self.papers[filename] = {
+            'url': url,
+            'path': os.path.relpath(path, self.subject_dir).replace(os.sep, '/'),
+            'size': os.path.getsize(path),
+            'sha256': file_sha256(path),
+            'etag': validators.get('etag', ''),
+            'last_modified': validators.get('last_modified', ''),
+            'synced_at': int(time.time()),
+        }
@@ -0,0 +1,197 @@
+"""
+Runtime metrics of a backend worker process.
+LoopLagMonitor measures event-loop lag: how late a periodic wake-up fires.
+Anything that blocks the loop (disk writes, HTML parsing, PDF work) delays
+every request the worker is serving, so lag is the first number to watch
+under load.
+
+Spans time the phases of a request (semaphore waits, jitter, network,
+parsing, ...) into the RequestTimings of the current context, if any, and
+RequestProfiler captures an opt-in cProfile of a single request. Peak RSS
+is measured with `resource` where the platform has it.
+"""
+import io
+import os
+import re
+import sys
+import time
+import uuid
+import asyncio
+import cProfile
+import pstats
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Return the q-th percentile of already sorted samples, or 0.0 if empty."""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class LoopLagMonitor:
+    """Sample the event loop's scheduling delay every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.05, keep: float = 600):
+        self.interval = interval
+        self.keep = keep
+        # (monotonic time, lag in seconds)
+        self._samples: Deque[Tuple[float, float]] = deque()
+
+    async def run(self):
+        """Record the lag of every wake-up until the task is cancelled."""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._samples.append((now, max(0.0, now - start - self.interval)))
+            while self._samples[0][0] < now - self.keep:
+                self._samples.popleft()
+
+    def snapshot(self, window: Optional[float] = None) -> Dict[str, float]:
+        """Return lag percentiles (ms) over the last `window` seconds."""
+        since = time.monotonic() - window if window else float('-inf')
+        lags = sorted(lag for at, lag in self._samples if at >= since)
+        return {
+            'samples': len(lags),
+            'p50_ms': round(percentile(lags, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(lags, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(lags, 0.99) * 1000, 2),
+            'max_ms': round(lags[-1] * 1000, 2) if lags else 0.0,
+        }
+
+
+class RequestTimings:
+    """Total time and count per phase of one request.
+
+    Phases of concurrent work (e.g. several folders crawled at once) are
+    summed, so a phase can add up to more than the request's wall time.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        """Add one occurrence of a phase."""
+        phase = self.phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += 1
+
+    def elapsed(self) -> float:
+        """Return the seconds since the request started."""
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Return the phases as a Server-Timing header value."""
+        entries = [f'{name};dur={total * 1000:.1f};desc="{count}x"'
+                   for name, (total, count) in self.phases.items()]
+        entries.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(entries)
+
+    def as_dict(self) -> Dict[str, dict]:
+        """Return the phases in milliseconds, for structured logs."""
+        return {name: {'ms': round(total * 1000, 1), 'count': count}
+                for name, (total, count) in self.phases.items()}
+
+
+# Timings of the request being served; tasks it starts inherit them
+_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    'request_timings', default=None
+)
+
+
+def start_timings() -> Tuple[RequestTimings, contextvars.Token]:
+    """Start collecting spans for the current request."""
+    timings = RequestTimings()
+    return timings, _timings.set(timings)
+
+
+def stop_timings(token: contextvars.Token):
+    """Stop collecting spans started by start_timings."""
+    _timings.reset(token)
+
+
+def record_span(name: str, seconds: float):
+    """Add a measured phase to the current request, if one is being timed."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as one occurrence of a phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+class RequestProfiler:
+    """Capture cProfile statistics of one request at a time.
+
+    cProfile follows the thread, so other requests running on the same event
+    loop meanwhile show up too; profile on an otherwise idle worker.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._active: Optional[cProfile.Profile] = None
+
+    def start(self) -> bool:
+        """Start profiling unless a profile is already being captured."""
+        if self._active is not None:
+            return False
+        self._active = cProfile.Profile()
+        self._active.enable()
+        return True
+
+    def finish(self) -> str:
+        """Stop profiling, save the statistics and return their id."""
+        profile, self._active = self._active, None
+        profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        profile.dump_stats(os.path.join(self.directory, f"{profile_id}.pstats"))
+        return profile_id
+
+    def path(self, profile_id: str) -> str:
+        """Return the saved statistics of a profile id, or "" if unknown."""
+        if not re.fullmatch(r'[0-9a-f]{32}', profile_id):
+            return ""
+        path = os.path.join(self.directory, f"{profile_id}.pstats")
+        return path if os.path.exists(path) else ""
+
+    def summary(self, profile_id: str, limit: int = 40) -> str:
+        """Return the top functions of a saved profile by cumulative time."""
+        out = io.StringIO()
+        pstats.Stats(self.path(profile_id), stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+
+def reset_peak_rss():
+    """Restart the peak RSS measurement of this process, where the OS allows it (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss() -> Optional[int]:
+    """Return the peak resident set size of this process in bytes, if measurable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,173 @@
+"""
+Cross-source identity map and latency statistics for paper mirrors.
+The same CAIE paper is usually published by several sources, so downloads
+can fall back to (or race against) an alternate mirror.
+"""
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List
+from urllib.parse import unquote, urlparse
+
+# CAIE names carry the paper's identity: <syllabus>_<session><yy>_<type>[_<variant>],
+# e.g. 9702_s24_qp_11.pdf. Generic names ("specimen.pdf") could be any paper.
+PAPER_IDENTITY = re.compile(r'\d{4}_[fmsvwy]\d{2}_[a-z]{2}(_\d{1,2})?\.pdf')
+
+
+def normalize_paper_name(filename: str) -> str:
+    """Return the identity of a paper filename across all sources, or "" if it has none."""
+    name = unquote(os.path.basename(filename)).strip().lower()
+    name = re.sub(r'[\s\-]+', '_', name)
+    return name if PAPER_IDENTITY.fullmatch(name) else ""
+
+
+def paper_identity(url: str) -> str:
+    """Return the identity of the paper a URL serves, from the URL's own file name."""
+    return normalize_paper_name(urlparse(url).path)
+
+
+class MirrorIndex:
+    """Map normalized paper names to the URLs each mirror publishes them under.
+
+    Papers are only known by their URLs, so what a requester calls a paper
+    can never pair one URL with another paper's mirrors.
+    """
+
+    def __init__(self, max_papers: int = 50000):
+        self.max_papers = max_papers
+        self._papers: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+    def register(self, url: str):
+        """Record that a mirror serves the paper named by the URL."""
+        key = paper_identity(url)
+        host = urlparse(url).netloc
+        if not key or not host:
+            return
+
+        mirrors = self._papers.pop(key, {})
+        mirrors[host] = url
+        self._papers[key] = mirrors
+
+        # Drop the least recently registered papers beyond the cap
+        while len(self._papers) > self.max_papers:
+            self._papers.popitem(last=False)
+
+    def alternates(self, url: str) -> List[str]:
+        """Return the URLs of the same paper on other mirrors."""
+        host = urlparse(url).netloc
+        # Names without an identity are never registered, so they have no alternates
+        mirrors = self._papers.get(paper_identity(url), {})
+        return [alt for alt_host, alt in mirrors.items() if alt_host != host]
+
+
+class MirrorStats:
+    """Rolling per-host latency (time to response headers) and failure counts."""
+
+    DEFAULT_HEDGE_DELAY = 2.0
+    MIN_HEDGE_DELAY = 0.5
+
+    def __init__(self, window: int = 50, hedge_percentile: float = 0.95):
+        self.window = window
+        self.hedge_percentile = hedge_percentile
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._failures: Dict[str, Deque[float]] = {}
+
+    def record(self, host: str, latency: float):
+        """Record a successful response from a host."""
+        self._latencies.setdefault(host, deque(maxlen=self.window)).append(latency)
+
+    def record_failure(self, host: str):
+        """Record a failed request (error status, timeout or connection error)."""
+        self._failures.setdefault(host, deque(maxlen=self.window)).append(time.monotonic())
+
+    def percentile(self, host: str, q: float) -> float:
+        """Return the q-th latency percentile for a host, or 0.0 if unknown."""
+        samples = sorted(self._latencies.get(host, ()))
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def failure_rate(self, host: str) -> float:
+        """Return the share of recent requests to a host that failed."""
+        failures = len(self._failures.get(host, ()))
+        total = failures + len(self._latencies.get(host, ()))
+        return failures / total if total else 0.0
+
+    def hedge_delay(self, host: str) -> float:
+        """Return how long to wait on a host before hedging to another mirror."""
+        delay = self.percentile(host, self.hedge_percentile)
+        if not delay:
+            return self.DEFAULT_HEDGE_DELAY
+        return max(self.MIN_HEDGE_DELAY, delay)
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """Order URLs so the most reliable and fastest mirror comes first."""
+        def score(url: str):
+            host = urlparse(url).netloc
+            median = self.percentile(host, 0.5) or self.DEFAULT_HEDGE_DELAY
+            return (round(self.failure_rate(host), 1), median)
+        return sorted(urls, key=score)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return a JSON-friendly summary of the stats per host."""
+        hosts = set(self._latencies) | set(self._failures)
+        return {
+            host: {
+                'p50': round(self.percentile(host, 0.5), 3),
+                'p95': round(self.percentile(host, 0.95), 3),
+                'failure_rate': round(self.failure_rate(host), 3),
+                'samples': len(self._latencies.get(host, ())),
+            }
+            for host in sorted(hosts)
+        }
+
+
+class CircuitBreaker:
+    """Per-host breaker that fails fast while a mirror keeps failing.
+
+    After `threshold` consecutive failures the host is skipped for `cooldown`
+    seconds; then a single probe request is let through to test recovery.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._probe_started: Dict[str, float] = {}
+
+    def allow(self, host: str) -> bool:
+        """Return whether a request to host may be sent now."""
+        until = self._open_until.get(host)
+        if until is None:
+            return True
+        now = time.monotonic()
+        if now < until:
+            return False
+        # Half-open: one probe at a time (a stuck probe is replaced after a cooldown)
+        probe = self._probe_started.get(host)
+        if probe is not None and now - probe < self.cooldown:
+            return False
+        self._probe_started[host] = now
+        return True
+
+    def is_open(self, host: str) -> bool:
+        """Return whether host is currently being skipped."""
+        until = self._open_until.get(host)
+        return until is not None and time.monotonic() < until
+
+    def record_success(self, host: str):
+        """Close the circuit of a host that answered."""
+        self._failures.pop(host, None)
+        self._open_until.pop(host, None)
+        self._probe_started.pop(host, None)
+
+    def record_failure(self, host: str):
+        """Count a transient failure and open the circuit past the threshold."""
+        self._probe_started.pop(host, None)
+        count = self._failures.get(host, 0) + 1
+        self._failures[host] = count
+        if count >= self.threshold:
+            self._open_until[host] = time.monotonic() + self.cooldown
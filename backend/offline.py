@@ -0,0 +1,150 @@
+"""
+Offline mirror: answer the API from a local paper tree instead of scraping.
+The CLI saves papers as <board>/<level>/<subject>/<category>/<file>.pdf. A
+listing index of such a tree is built once (python backend/offline.py <dir>)
+and loaded at startup, so boards, subjects and paper listings are served from
+memory and papers straight from disk, without a single upstream request.
+"""
+import os
+import json
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+try:
+    from backend.diskio import atomic_path
+except ImportError:
+    from diskio import atomic_path
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'examquest_index.json'
+# Top-level directories the CLI creates; anything else next to them is ignored
+BOARDS = ('CAIE', 'Edexcel')
+SOURCE = 'offline'
+# Subjects and papers are addressed by their path in the tree, behind this prefix
+URL_PREFIX = 'offline:'
+
+
+def _subdirectories(path: str) -> List[str]:
+    with os.scandir(path) as entries:
+        return sorted(entry.name for entry in entries
+                      if entry.is_dir() and not entry.name.startswith('.'))
+
+
+def build_index(root: str) -> dict:
+    """Scan a paper tree and return its listing index."""
+    boards: Dict[str, dict] = {}
+    for board in (board for board in BOARDS if os.path.isdir(os.path.join(root, board))):
+        for level in _subdirectories(os.path.join(root, board)):
+            for subject in _subdirectories(os.path.join(root, board, level)):
+                subject_dir = os.path.join(root, board, level, subject)
+                papers = []
+                for category in _subdirectories(subject_dir):
+                    with os.scandir(os.path.join(subject_dir, category)) as entries:
+                        for entry in sorted(entries, key=lambda e: e.name):
+                            if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                                papers.append({
+                                    'name': entry.name,
+                                    'type': category,
+                                    'path': '/'.join((board, level, subject, category,
+                                                      entry.name)),
+                                    'size': entry.stat().st_size,
+                                })
+                if papers:
+                    boards.setdefault(board, {}).setdefault(level, {})[subject] = papers
+    return {'version': 1, 'boards': boards}
+
+
+def write_index(root: str) -> dict:
+    """Rebuild the listing index of a paper tree and save it in the tree."""
+    index = build_index(root)
+    # Servers starting meanwhile read the old index or the new one, never half of it
+    with atomic_path(os.path.join(root, INDEX_NAME)) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+    return index
+
+
+class OfflineMirror:
+    """Serve boards, subjects, listings and papers from a local paper tree."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        # board id -> (board, its levels); board -> level -> subject listings
+        self._boards: Dict[str, tuple] = {}
+        self._subjects: Dict[str, Dict[str, List[dict]]] = {}
+        # subject url -> paper records; paper url -> absolute path
+        self._papers: Dict[str, List[dict]] = {}
+        self._paths: Dict[str, str] = {}
+
+    def load(self):
+        """Load the tree's listing index, building it first if there is none."""
+        path = os.path.join(self.root, INDEX_NAME)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        else:
+            logger.warning("No listing index in %s, building one", self.root)
+            index = write_index(self.root)
+
+        for board, levels in index['boards'].items():
+            self._boards[f"{SOURCE}_{board.lower()}"] = (board, sorted(levels))
+            for level, subjects in levels.items():
+                listing = self._subjects.setdefault(board, {}).setdefault(level, [])
+                for subject, papers in subjects.items():
+                    subject_url = URL_PREFIX + '/'.join((board, level, subject))
+                    listing.append({'name': subject, 'url': subject_url})
+                    self._papers[subject_url] = [self._add_paper(paper) for paper in papers]
+        logger.info("Offline mirror %s: %d subject(s), %d paper(s)",
+                    self.root, len(self._papers), len(self._paths))
+
+    def _add_paper(self, paper: dict) -> dict:
+        """Remember where a paper of the index is and return its API record."""
+        path = os.path.abspath(os.path.join(self.root, paper['path']))
+        # An index edited by hand must not expose files outside the tree
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Paper outside the mirror: {paper['path']}")
+        url = URL_PREFIX + paper['path']
+        self._paths[url] = path
+        return {'name': paper['name'], 'url': url, 'type': paper['type']}
+
+    def boards(self) -> List[dict]:
+        """Return the boards of the tree, like the /boards of live sources."""
+        return [{'id': board_id, 'name': f"{board} - Offline mirror",
+                 'source': SOURCE, 'board': board}
+                for board_id, (board, _) in self._boards.items()]
+
+    def levels(self, board_id: str) -> List[str]:
+        """Return the levels of a board of the tree."""
+        return self._boards.get(board_id, ('', []))[1]
+
+    def subjects(self, board: str, level: str) -> List[dict]:
+        """Return the subjects of a board and level of the tree."""
+        return self._subjects.get(board, {}).get(level, [])
+
+    def papers(self, subject_url: str) -> Optional[List[dict]]:
+        """Return the categorized papers of a subject, or None if it is unknown."""
+        return self._papers.get(subject_url)
+
+    def paper_path(self, url: str) -> str:
+        """Return the file of a paper of the index, or "" if it is unknown."""
+        return self._paths.get(url, "")
+
+
+def main():
+    """Build the listing index of a paper tree."""
+    parser = argparse.ArgumentParser(
+        description="Index a <board>/<level>/<subject>/<category>/ paper tree so the "
+                    "backend can serve it with EXAMQUEST_OFFLINE_MIRROR.")
+    parser.add_argument("root", help="directory of the paper tree, e.g. where the CLI ran")
+    root = parser.parse_args().root
+    index = write_index(root)
+    subjects = [papers for levels in index['boards'].values()
+                for listing in levels.values() for papers in listing.values()]
+    print(f"Indexed {sum(map(len, subjects))} paper(s) in {len(subjects)} subject(s) "
+          f"into {os.path.join(root, INDEX_NAME)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Bounded-memory PDF merging.
+PdfWriter keeps every appended page, with its images and fonts, in memory
+until the whole bundle is written, so merging hundreds of scanned papers needs
+gigabytes. Merging in chunks does not help: the final concatenation holds
+everything again. StreamingPdfMerger instead writes each input's objects to the
+output as soon as they are read, so memory holds a single input at a time.
+"""
+from collections import deque
+from typing import BinaryIO, Deque, Dict, List, Optional, Tuple
+
+from pypdf import PdfReader
+from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject,
+                           StreamObject)
+
+# Rough peak memory of a merge process, measured with scanned papers: the
+# interpreter with pypdf loaded, plus a multiple of the bytes held at once
+MERGE_BASE_MEMORY = 64 * 1024 * 1024
+IN_MEMORY_FACTOR = 2.0
+STREAMING_FACTOR = 3.0
+# Page attributes a page may inherit from the /Pages nodes above it
+INHERITABLE = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+
+def estimate_merge_memory(sizes: List[int], streaming: bool) -> int:
+    """Estimate the peak memory (bytes) of merging inputs of these sizes."""
+    if not sizes:
+        return MERGE_BASE_MEMORY
+    held = max(sizes) * STREAMING_FACTOR if streaming else sum(sizes) * IN_MEMORY_FACTOR
+    return MERGE_BASE_MEMORY + int(held)
+
+
+class StreamingPdfMerger:
+    """Concatenate the pages of PDFs into one output, one input at a time.
+
+    Only pages and what they reference are copied: bookmarks and other
+    document-level structure of the inputs are dropped.
+    """
+    _CATALOG = 1
+    _PAGES = 2
+
+    def __init__(self, out: BinaryIO):
+        self._out = out
+        # File offset of every written object, by object number (0 is reserved)
+        self._offsets: List[int] = [0, 0, 0]
+        self._kids: List[int] = []
+        # Per input: its (idnum, generation) -> our object number, and its pages
+        # with the attributes they inherit from the input's page tree
+        self._numbers: Dict[Tuple[int, int], int] = {}
+        self._pending: Deque[IndirectObject] = deque()
+        self._pages: Dict[Tuple[int, int], dict] = {}
+        out.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def _number(self, ref: IndirectObject) -> int:
+        """Return the output number of an input object, queueing it for writing."""
+        key = (ref.idnum, ref.generation)
+        if key not in self._numbers:
+            self._numbers[key] = len(self._offsets)
+            self._offsets.append(0)
+            self._pending.append(ref)
+        return self._numbers[key]
+
+    def append(self, path: str):
+        """Copy every page of a PDF, and the objects they use, to the output."""
+        with open(path, 'rb') as f:
+            # Given a file object, PdfReader reads objects lazily instead of the whole file
+            reader = PdfReader(f)
+            if reader.is_encrypted:
+                reader.decrypt('')
+            self._numbers, self._pending, self._pages = {}, deque(), {}
+            for page in reader.pages:
+                ref = page.indirect_reference
+                self._pages[(ref.idnum, ref.generation)] = self._inherited(ref.get_object())
+                self._kids.append(self._number(ref))
+            while self._pending:
+                ref = self._pending.popleft()
+                key = (ref.idnum, ref.generation)
+                self._write_object(self._numbers[key], ref.get_object(), self._pages.get(key))
+
+    @staticmethod
+    def _inherited(page: DictionaryObject) -> dict:
+        """Return the attributes a page inherits, as its /Pages ancestors define them.
+
+        Takes the page as stored: reader.pages has them copied in, but only in memory.
+        """
+        inherited = {}
+        node = page.get('/Parent')
+        # The page leaves its input's page tree, so it must carry them itself
+        while node is not None:
+            node = node.get_object()
+            for key in INHERITABLE:
+                if key not in page and key not in inherited and key in node:
+                    inherited[key] = node.raw_get(key)
+            node = node.get('/Parent')
+        return inherited
+
+    def _write_object(self, number: int, obj, inherited: Optional[dict]):
+        """Write an object; inherited is given for pages, with the attributes they lack."""
+        self._offsets[number] = self._out.tell()
+        self._out.write(b'%d 0 obj\n' % number)
+        if obj is None:
+            self._out.write(b'null')
+        else:
+            self._write_value(obj, inherited)
+        self._out.write(b'\nendobj\n')
+
+    def _write_value(self, value, inherited: Optional[dict] = None):
+        """Serialize a value, renumbering the objects it references."""
+        page = inherited is not None
+        out = self._out
+        if isinstance(value, IndirectObject):
+            out.write(b'%d 0 R' % self._number(value))
+        elif isinstance(value, DictionaryObject):
+            out.write(b'<<')
+            for key, item in value.items():
+                if isinstance(value, StreamObject) and key == '/Length':
+                    continue
+                out.write(b'\n')
+                key.write_to_stream(out)
+                out.write(b' ')
+                if page and key == '/Parent':
+                    # Pages hang off our page tree instead of their input's
+                    out.write(b'%d 0 R' % self._PAGES)
+                else:
+                    self._write_value(item)
+            for key, item in (inherited or {}).items():
+                out.write(b'\n')
+                NameObject(key).write_to_stream(out)
+                out.write(b' ')
+                self._write_value(item)
+            if isinstance(value, StreamObject):
+                # The raw, still encoded bytes are copied as they are
+                data = value._data  # pylint: disable=protected-access
+                out.write(b'\n/Length %d\n>>\nstream\n' % len(data))
+                out.write(data)
+                out.write(b'\nendstream')
+            else:
+                out.write(b'\n>>')
+        elif isinstance(value, ArrayObject):
+            out.write(b'[')
+            for item in value:
+                out.write(b' ')
+                self._write_value(item)
+            out.write(b' ]')
+        else:
+            value.write_to_stream(out)
+
+    def _write_raw(self, number: int, body: bytes):
+        self._offsets[number] = self._out.tell()
+        self._out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table."""
+        kids = b' '.join(b'%d 0 R' % kid for kid in self._kids)
+        self._write_raw(self._PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                        % (kids, len(self._kids)))
+        self._write_raw(self._CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self._PAGES)
+
+        xref = self._out.tell()
+        self._out.write(b'xref\n0 %d\n0000000000 65535 f \n' % len(self._offsets))
+        for offset in self._offsets[1:]:
+            self._out.write(b'%010d 00000 n \n' % offset)
+        self._out.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                        % (len(self._offsets), self._CATALOG, xref))
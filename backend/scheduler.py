@@ -0,0 +1,189 @@
+"""
+Priority and fair-share scheduling of upstream work inside one worker.
+Upstream requests run on behalf of a client at a priority class, both carried
+in contextvars set for each API request: interactive calls go ahead of bulk
+merges, which go ahead of background prefetching, and within a class waiting
+clients take turns. When too much work is already queued, new API requests
+are refused with QueueFull, which the API answers with 429 and a Retry-After
+estimate. An admitted request holds its place until its response is finished,
+and is never refused halfway through its work.
+"""
+import math
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Deque, Dict, Optional, Set
+
+
+class Priority(IntEnum):
+    """Scheduling class of upstream work; lower values are served first."""
+    INTERACTIVE = 0
+    BULK = 1
+    PREFETCH = 2
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    'work_priority', default=Priority.INTERACTIVE
+)
+_client: contextvars.ContextVar[str] = contextvars.ContextVar('work_client', default='')
+_admitted: contextvars.ContextVar[bool] = contextvars.ContextVar('work_admitted', default=False)
+
+
+@contextmanager
+def work_context(priority: Priority, client: Optional[str] = None, admitted: bool = False):
+    """Run the enclosed work (and the tasks it starts) at a priority, for a client.
+
+    Work that was admitted up front queues without being checked again.
+    """
+    priority_token = _priority.set(priority)
+    client_token = _client.set(client) if client is not None else None
+    admitted_token = _admitted.set(admitted)
+    try:
+        yield
+    finally:
+        _admitted.reset(admitted_token)
+        if client_token is not None:
+            _client.reset(client_token)
+        _priority.reset(priority_token)
+
+
+class QueueFull(RuntimeError):
+    """Raised instead of queueing work when the scheduler is saturated."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too much upstream work queued, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """Semaphore that grants permits by priority class, then round-robin by client.
+
+    New work is admitted while fewer than `max_queue` places are taken, by
+    admitted requests still in flight and by other acquisitions waiting; each
+    lower class may only fill half the places of the class above it, and one
+    client may not take more than `max_per_client`, so bulk work is refused
+    before it can crowd out interactive users.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, slots: int, max_queue: int = 100, max_per_client: int = 20):
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self._free = slots
+        # Per class: client -> its waiters, in turn order
+        self._waiting: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._queued = 0
+        # Places taken by admitted requests and by waiters that were not admitted
+        self._places = 0
+        self._places_by_client: Dict[str, int] = {}
+        self._unadmitted: Set[asyncio.Future] = set()
+        # Smoothed seconds between releases, to estimate Retry-After
+        self._release_interval = 1.0
+        self._last_release = time.monotonic()
+
+    def retry_after(self) -> int:
+        """Return the seconds until the current queue should have drained."""
+        waiting = max(self._queued, self._places)
+        return max(1, min(120, math.ceil(waiting * self._release_interval)))
+
+    def _take_place(self, client: str, delta: int):
+        self._places += delta
+        count = self._places_by_client.get(client, 0) + delta
+        if count:
+            self._places_by_client[client] = count
+        else:
+            self._places_by_client.pop(client, None)
+
+    def _check(self, priority: Priority, client: str):
+        """Raise QueueFull if no place is left for work of this class and client."""
+        if (self._places >= self.max_queue >> priority
+                or self._places_by_client.get(client, 0) >= self.max_per_client):
+            raise QueueFull(self.retry_after())
+
+    def admit(self, priority: Priority, client: str):
+        """Take a place for a request about to start, or raise QueueFull.
+
+        The place is held until the request calls leave(), once its response
+        is finished, so a burst cannot all be admitted before any of it queues.
+        """
+        self._check(priority, client)
+        self._take_place(client, 1)
+
+    def leave(self, client: str):
+        """Give back the place an admitted request of client took."""
+        self._take_place(client, -1)
+
+    def _dequeued(self, client: str, future: asyncio.Future):
+        """Stop counting a waiter, and the place it took if it was not admitted."""
+        self._queued -= 1
+        if future in self._unadmitted:
+            self._unadmitted.remove(future)
+            self._take_place(client, -1)
+
+    def _discard(self, priority: Priority, client: str, future: asyncio.Future):
+        """Remove a waiter that gave up before being granted a permit."""
+        waiters = self._waiting[priority].get(client)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        if not waiters:
+            del self._waiting[priority][client]
+        self._dequeued(client, future)
+
+    def locked(self) -> bool:
+        """Return whether acquire() would have to wait."""
+        return not self._free or bool(self._queued)
+
+    async def acquire(self) -> bool:
+        """Wait for a permit in priority and client turn order."""
+        priority, client = _priority.get(), _client.get()
+        if self._free and not self._queued:
+            self._free -= 1
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        if not _admitted.get():
+            # Waits without an admitted request's place, e.g. prefetching: take one
+            self._check(priority, client)
+            self._unadmitted.add(future)
+            self._take_place(client, 1)
+        self._waiting[priority].setdefault(client, deque()).append(future)
+        self._queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the waiter was cancelled: pass the permit on
+                self.release()
+            else:
+                self._discard(priority, client, future)
+            raise
+        return True
+
+    def release(self):
+        """Hand the permit to the next waiter, or return it to the pool."""
+        now = time.monotonic()
+        if self._queued:
+            self._release_interval = (0.8 * self._release_interval
+                                      + 0.2 * (now - self._last_release))
+        self._last_release = now
+
+        for priority in Priority:
+            clients = self._waiting[priority]
+            while clients:
+                client, waiters = next(iter(clients.items()))
+                future = waiters.popleft()
+                # The client goes to the back of its class' line
+                del clients[client]
+                if waiters:
+                    clients[client] = waiters
+                self._dequeued(client, future)
+                if not future.done():
+                    future.set_result(True)
+                    return
+        self._free += 1
@@ -2,21 +2,88 @@
 Service for scraping exam papers from xtremepapers, papacambridge, and pastpapers.co.
 Updated to use asynchronous requests with politeness techniques.
 """
+import gc
 import os
 import json
 import re
 import asyncio
 import random
+import time
 import hashlib
-from typing import Dict, List
-from urllib.parse import urljoin, urlparse
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urljoin, urlparse
 
 import aiohttp
 from bs4 import BeautifulSoup
 from pypdf import PdfWriter
 
+try:
+    from backend.blobs import BlobStore
+    from backend.crawl import CrawlContext, walk_folders
+    from backend.diskio import DiskIO
+    from backend.downloads import InFlightDownload, paper_validators
+    from backend.hedging import HedgedOpener
+    from backend.metrics import peak_rss, record_span, reset_peak_rss, span
+    from backend.mirrors import CircuitBreaker, MirrorIndex, MirrorStats
+    from backend.pdfmerge import StreamingPdfMerger
+    from backend.scheduler import FairScheduler
+    from backend.shared_state import (DEFAULT_STATE_PATH, SharedSemaphore, StateStore,
+                                      shared_lock)
+except ImportError:
+    from blobs import BlobStore
+    from crawl import CrawlContext, walk_folders
+    from diskio import DiskIO
+    from downloads import InFlightDownload, paper_validators
+    from hedging import HedgedOpener
+    from metrics import peak_rss, record_span, reset_peak_rss, span
+    from mirrors import CircuitBreaker, MirrorIndex, MirrorStats
+    from pdfmerge import StreamingPdfMerger
+    from scheduler import FairScheduler
+    from shared_state import DEFAULT_STATE_PATH, SharedSemaphore, StateStore, shared_lock
+
+
+def merge_pdf_files(file_paths: List[str], output_path: str, streaming: bool = False) -> dict:
+    """Merge PDFs from temp_downloads into output_path and report what it cost.
+
+    A streaming merge holds one input in memory at a time but drops the inputs'
+    bookmarks. The reported peak RSS is that of the merging process, including
+    what it already held. Kept at module level so it can run in a process pool, off the
+    event loop.
+    """
+    # Free what earlier merges in this process left in reference cycles first
+    gc.collect()
+    reset_peak_rss()
+    base_dir = os.path.abspath('temp_downloads')
+    # Strong sanitization for CodeQL: only use basename
+    safe_pdf_paths = [os.path.join(base_dir, os.path.basename(pdf)) for pdf in file_paths]
+    safe_pdf_paths = [path for path in safe_pdf_paths if os.path.exists(path)]
+
+    with open(output_path, 'wb') as f:
+        if streaming:
+            streamer = StreamingPdfMerger(f)
+            for safe_pdf_path in safe_pdf_paths:
+                streamer.append(safe_pdf_path)
+            streamer.close()
+        else:
+            merger = PdfWriter()
+            for safe_pdf_path in safe_pdf_paths:
+                merger.append(safe_pdf_path)
+            merger.write(f)
+            merger.close()
+
+    return {
+        'mode': 'streaming' if streaming else 'in_memory',
+        'inputs': len(safe_pdf_paths),
+        'input_bytes': sum(os.path.getsize(path) for path in safe_pdf_paths),
+        'output_bytes': os.path.getsize(output_path),
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
 class ExamScraperService:
     """Service to handle scraping operations for different exam boards and sources."""
+    # pylint: disable=too-many-instance-attributes
 
     BASE_URL = 'https://papers.xtremepape.rs/'
 
@@ -30,10 +97,49 @@ class ExamScraperService:
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0'
     ]
 
-    def __init__(self):
-        # Limit concurrency to 5 requests at a time
-        self.semaphore = asyncio.Semaphore(5)
+    # Statuses worth retrying: rate limiting and transient server errors
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    MAX_ATTEMPTS = 4
+    BACKOFF_BASE = 1.0
+    MAX_BACKOFF = 8.0
+
+    def __init__(self, state_path: str = DEFAULT_STATE_PATH, concurrency: int = 5,
+                 jitter: Tuple[float, float] = (0.5, 2.0), upstream_override: str = "",
+                 scheduler: Optional[FairScheduler] = None, disk: Optional[DiskIO] = None):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # State shared with other worker processes (and the CLI) on this host
+        self.state = StateStore(state_path)
+        # Limit concurrency to 5 requests at a time across all processes; within
+        # this process, interactive work goes first and clients take turns
+        self.scheduler = scheduler or FairScheduler(concurrency)
+        self.semaphore = SharedSemaphore(self.state, 'upstream', concurrency,
+                                         local=self.scheduler)
         self._rand = random.SystemRandom()
+        # Politeness delay range (seconds) before each page request
+        self.jitter = jitter
+        # Send upstream requests to <override>/<host>/<path> instead, e.g. a fake
+        # mirror for load tests; trust checks and stats still use the real URL
+        self.upstream_override = upstream_override.rstrip('/')
+        # Same paper across sources, and which source tends to answer fastest
+        self.mirror_index = MirrorIndex()
+        self.mirror_stats = MirrorStats()
+        # Fail fast while a mirror is down instead of queueing behind timeouts
+        self.breaker = CircuitBreaker()
+        # Downloads race a paper's mirrors, each request in an upstream slot of its own
+        self.hedged = HedgedOpener(self._open_mirror, self._take_slot, self.semaphore.release,
+                                   self.mirror_stats)
+        # Total requests sent upstream, reported by /metrics
+        self.upstream_requests = 0
+        # Papers being cached right now, by local path, so requesters can share them
+        self._downloads: Dict[str, InFlightDownload] = {}
+        # File writes and reads of downloads run off the event loop
+        self.disk = disk or DiskIO()
+        # Created once here instead of on every get_safe_path call
+        self.download_dir = os.path.abspath('temp_downloads')
+        os.makedirs(self.download_dir, exist_ok=True)
+        # Identical papers from different sources are stored once
+        self.blobs = BlobStore(os.path.abspath(os.path.join('temp_downloads', 'blobs')),
+                               self.state)
 
     def _get_headers(self, url: str, referer: str = None) -> Dict[str, str]:
         """Return realistic headers to avoid bot detection."""
@@ -112,6 +218,14 @@ class ExamScraperService:
             return f"{base.rstrip('/')}/{path}{query}"
         return ""
 
+    def _wire_url(self, safe_url: str) -> str:
+        """Return the URL actually requested for a trusted upstream URL."""
+        if not self.upstream_override:
+            return safe_url
+        parsed = urlparse(safe_url)
+        query = f"?{parsed.query}" if parsed.query else ""
+        return f"{self.upstream_override}/{parsed.netloc}{parsed.path}{query}"
+
     def _is_trusted_url(self, url: str) -> bool:
         """Verify if the URL belongs to a trusted scraping domain strictly."""
         return bool(self._get_safe_url(url))
@@ -120,8 +234,7 @@ class ExamScraperService:
         """Ensure the path is strictly within the temp_downloads directory."""
         # Force basename to prevent any directory traversal strings
         clean_name = os.path.basename(filename)
-        base_dir = os.path.abspath('temp_downloads')
-        os.makedirs(base_dir, exist_ok=True)
+        base_dir = self.download_dir
 
         target_path = os.path.abspath(os.path.join(base_dir, clean_name))
 
@@ -131,44 +244,152 @@ class ExamScraperService:
 
         return target_path
 
+    def cached_paper_path(self, url: str) -> str:
+        """Return the local path of an already downloaded paper, or ""."""
+        safe_url = self._get_safe_url(url)
+        if not safe_url:
+            return ""
+        url_hash = hashlib.sha256(safe_url.encode()).hexdigest()
+        path = self.get_safe_path(f"{url_hash}.pdf")
+        return path if os.path.exists(path) else ""
+
+    def _count_request(self, ctx: Optional[CrawlContext]) -> bool:
+        """Count one request about to be sent upstream, globally and for the current crawl.
+
+        Returns False, counting nothing, when the crawl's budget does not allow it.
+        """
+        if ctx is not None:
+            if ctx.exhausted:
+                return False
+            ctx.upstream_requests += 1
+        self.upstream_requests += 1
+        return True
+
     async def _fetch_html(self, session: aiohttp.ClientSession, url: str,
-                          referer: str = None) -> str:
-        """Wrapper for aiohttp GET requests with semaphore and jitter."""
+                          referer: str = None, ctx: Optional[CrawlContext] = None) -> str:
+        """Fetch a page, memoized per crawl when a CrawlContext is given."""
+        if ctx is not None:
+            return await ctx.page(url, lambda: self._request_html(session, url, referer, ctx))
+        return await self._request_html(session, url, referer)
+
+    async def _fetch_soup(self, session: aiohttp.ClientSession, url: str,
+                          ctx: Optional[CrawlContext] = None) -> Optional[BeautifulSoup]:
+        """Fetch and parse a page, or return None if it could not be fetched."""
+        if ctx is not None:
+            return await ctx.soup(url, lambda: self._request_html(session, url, None, ctx))
+        html = await self._request_html(session, url)
+        if not html:
+            return None
+        with span('parse'):
+            return BeautifulSoup(html, 'html.parser')
+
+    @asynccontextmanager
+    async def _upstream_slot(self):
+        """Hold an upstream slot, timing the wait for it as the 'semaphore' phase."""
+        owner = await self._take_slot()
+        try:
+            yield
+        finally:
+            await self.semaphore.release(owner)
+
+    async def _take_slot(self, wait: bool = True) -> str:
+        """Take an upstream slot and return its owner, or "" if none is free and not wait."""
+        start = time.perf_counter()
+        owner = await self.semaphore.acquire(wait)
+        record_span('semaphore', time.perf_counter() - start)
+        return owner
+
+    async def _request_html(self, session: aiohttp.ClientSession, url: str,
+                            referer: str = None, ctx: Optional[CrawlContext] = None) -> str:
+        """GET a page with retries, exponential backoff and a per-host circuit breaker.
+
+        Returns "" when the page does not exist (404), or when it could not be
+        fetched, then marking the crawl context incomplete so partial listings
+        are never cached as complete.
+        """
         safe_url = self._get_safe_url(url)
         if not safe_url:
             print(f"Untrusted URL blocked: {url}")
             return ""
 
-        async with self.semaphore:
-            # Random jitter between 0.5 and 2.0 seconds for better human-like behavior
-            await asyncio.sleep(self._rand.uniform(0.5, 2.0))
+        host = urlparse(safe_url).netloc
+        # Use the URL's parent or base domain as referer if not provided
+        if not referer:
+            referer = urljoin(url, '.')
+
+        for attempt in range(self.MAX_ATTEMPTS):
+            if attempt:
+                with span('backoff'):
+                    await asyncio.sleep(self._backoff_delay(attempt))
+            if ctx is not None and ctx.exhausted:
+                break
+            if not self.breaker.allow(host):
+                print(f"Circuit open for {host}, skipping {url}")
+                break
+
+            async with self._upstream_slot():
+                # Random jitter (0.5 to 2.0 seconds by default) for better human-like behavior
+                with span('jitter'):
+                    await asyncio.sleep(self._rand.uniform(*self.jitter))
+                with span('network'):
+                    html, retryable = await self._get_page_once(session, url, safe_url,
+                                                                referer, ctx)
+            if html is not None:
+                return html
+            if not retryable:
+                break
+
+        if ctx is not None:
+            ctx.mark_failed(url)
+        return ""
 
-            try:
-                # Use the URL's parent or base domain as referer if not provided
-                if not referer:
-                    referer = urljoin(url, '.')
-
-                timeout = aiohttp.ClientTimeout(total=20)
-                async with session.get(safe_url, headers=self._get_headers(safe_url, referer),
-                                     timeout=timeout) as response:
-                    if response.status == 200:
-                        return await response.text()
-                    if response.status == 403:
-                        print(f"Access Denied (403) for {url}. Might be Cloudflare challenge.")
-                        # Try a fallback with no referer at all or different domain
-                        if referer != 'https://www.google.com/':
-                            await asyncio.sleep(1)
-                            headers = self._get_headers(safe_url, 'https://www.google.com/')
-                            async with session.get(safe_url, headers=headers,
-                                                 timeout=timeout) as retry_res:
-                                if retry_res.status == 200:
-                                    return await retry_res.text()
-
-                    print(f"Failed to fetch {url}: Status {response.status}")
-                    return ""
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                print(f"Request error for {url}: {e}")
-                return ""
+    def _backoff_delay(self, attempt: int) -> float:
+        """Return the sleep before a retry: exponential, capped, with jitter."""
+        delay = min(self.MAX_BACKOFF, self.BACKOFF_BASE * 2 ** (attempt - 1))
+        return delay + self._rand.uniform(0, self.BACKOFF_BASE)
+
+    async def _get_page_once(self, session: aiohttp.ClientSession, url: str, safe_url: str,
+                             referer: str, ctx: Optional[CrawlContext]):
+        """Send one GET; return (html or None, whether a retry may help)."""
+        host = urlparse(safe_url).netloc
+        timeout = aiohttp.ClientTimeout(total=20)
+        start = time.monotonic()
+        # Checked again now: other pages of the crawl may have spent the budget meanwhile
+        if not self._count_request(ctx):
+            return None, False
+        try:
+            async with session.get(self._wire_url(safe_url),
+                                   headers=self._get_headers(safe_url, referer),
+                                   timeout=timeout) as response:
+                if response.status in (200, 404):
+                    # A missing page is an answer too: the folder is empty, not unreachable
+                    html = await response.text() if response.status == 200 else ""
+                    self.mirror_stats.record(host, time.monotonic() - start)
+                    self.breaker.record_success(host)
+                    return html, False
+                self.mirror_stats.record_failure(host)
+                if response.status == 403:
+                    print(f"Access Denied (403) for {url}. Might be Cloudflare challenge.")
+                    # Try a fallback with no referer at all or different domain
+                    if referer != 'https://www.google.com/' and self._count_request(ctx):
+                        await asyncio.sleep(1)
+                        headers = self._get_headers(safe_url, 'https://www.google.com/')
+                        async with session.get(self._wire_url(safe_url), headers=headers,
+                                               timeout=timeout) as retry_res:
+                            if retry_res.status == 200:
+                                self.breaker.record_success(host)
+                                return await retry_res.text(), False
+
+                print(f"Failed to fetch {url}: Status {response.status}")
+                retryable = response.status in self.RETRY_STATUSES
+                if retryable or response.status == 403:
+                    self.breaker.record_failure(host)
+                return None, retryable
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.mirror_stats.record_failure(host)
+            self.breaker.record_failure(host)
+            print(f"Request error for {url}: {e}")
+            return None, True
 
     async def get_xtremepapers_subjects(self, session: aiohttp.ClientSession,
                                         exam_board: str,
@@ -181,7 +402,8 @@ class ExamScraperService:
         if not html:
             return {}
 
-        soup = BeautifulSoup(html, 'html.parser')
+        with span('parse'):
+            soup = BeautifulSoup(html, 'html.parser')
         subject_links = soup.find_all('a', class_='directory')
 
         subjects = {}
@@ -212,7 +434,8 @@ class ExamScraperService:
         if not html:
             return {}
 
-        soup = BeautifulSoup(html, 'html.parser')
+        with span('parse'):
+            soup = BeautifulSoup(html, 'html.parser')
         return self._parse_pc_subjects(soup, url)
 
     def _parse_pc_subjects(self, soup: BeautifulSoup, base_url: str) -> Dict[str, str]:
@@ -225,10 +448,10 @@ class ExamScraperService:
             link = item.find('a')
             if not link:
                 continue
-            span = link.find('span', class_='wraptext')
-            if not span:
+            name_span = link.find('span', class_='wraptext')
+            if not name_span:
                 continue
-            name = span.text.strip()
+            name = name_span.text.strip()
             if not name or name == '..':
                 continue
 
@@ -237,120 +460,131 @@ class ExamScraperService:
         return subjects
 
     async def get_pdfs(self, session: aiohttp.ClientSession, subject_url: str,
-                       exam_board: str, source: str) -> Dict[str, str]:
+                       exam_board: str, source: str,
+                       ctx: Optional[CrawlContext] = None) -> Dict[str, str]:
         """Fetch PDF links for the selected subject."""
-        if source == 'papacambridge':
-            return await self._get_papacambridge_pdfs(session, subject_url)
-
-        if source == 'pastpapers_co':
-            return await self._get_pastpapers_co_pdfs(session, subject_url)
-
-        if exam_board == 'Edexcel':
-            return await self._get_edexcel_pdfs(session, subject_url)
-
-        html = await self._fetch_html(session, subject_url)
-        if not html:
-            return {}
-
-        soup = BeautifulSoup(html, 'html.parser')
-        pdf_links = soup.find_all('a', class_='file', href=re.compile(r'\.pdf$'))
-        return {
-            link.text.strip(): urljoin(self.BASE_URL, link['href'])
-            for link in pdf_links
-        }
-
-    async def _get_edexcel_pdfs(self, session: aiohttp.ClientSession,
-                                subject_url: str) -> Dict[str, str]:
-        """Fetch PDF links for Edexcel subjects from xtremepapers."""
-        html = await self._fetch_html(session, subject_url)
-        if not html:
-            return {}
-
-        soup = BeautifulSoup(html, 'html.parser')
-        year_links = soup.find_all('a', class_='directory')
+        pdfs = {}
+        async for filename, url in self.iter_pdfs(session, subject_url, exam_board,
+                                                  source, ctx):
+            pdfs[filename] = url
+        return pdfs
 
-        tasks = []
-        for year_link in year_links:
+    async def iter_pdfs(self, session: aiohttp.ClientSession, subject_url: str,
+                        exam_board: str, source: str, ctx: Optional[CrawlContext] = None,
+                        *, workers: int = 5) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (filename, url) records of a subject as its folders are crawled.
+
+        The folder tree is walked by `workers` concurrent visitors over a bounded
+        frontier, and the crawl pauses while the consumer is not keeping up.
+        A filename found in several folders is yielded once, with the first URL
+        found, so /papers and /papers/stream list the same papers.
+        """
+        # pylint: disable=too-many-arguments
+        ctx = ctx or CrawlContext()
+        if source in ('papacambridge', 'pastpapers_co'):
+            root = (source, subject_url)
+        elif exam_board == 'Edexcel':
+            root = ('edexcel', subject_url)
+        else:
+            root = ('xtremepapers', subject_url)
+
+        async def visit(folder):
+            kind, url = folder
+            pdfs, children = await getattr(self, f'_visit_{kind}')(session, url, ctx)
+            return list(pdfs.items()), children
+
+        seen = set()
+        async for filename, url in walk_folders(root, visit, workers=workers):
+            # Remember where each paper lives so downloads can use alternate mirrors;
+            # crawls are the only source of mirrors, never what a requester sends
+            self.mirror_index.register(url)
+            if filename not in seen:
+                seen.add(filename)
+                yield filename, url
+        print(f"Crawled {subject_url}: {ctx.summary()}")
+
+    # Folder visitors: each returns ({filename: url}, [(kind, url) sub-folders])
+
+    async def _visit_xtremepapers(self, session: aiohttp.ClientSession, url: str,
+                                  ctx: CrawlContext):
+        """Collect the PDF links of one xtremepapers folder."""
+        soup = await self._fetch_soup(session, url, ctx)
+        if soup is None:
+            return {}, []
+        return self._parse_xtremepapers_pdfs(soup), []
+
+    async def _visit_edexcel(self, session: aiohttp.ClientSession, subject_url: str,
+                             ctx: CrawlContext):
+        """List the year folders of an Edexcel subject on xtremepapers."""
+        soup = await self._fetch_soup(session, subject_url, ctx)
+        if soup is None:
+            return {}, []
+
+        years = []
+        # Newest years first, so they get upstream slots (and stream out) first
+        for year_link in self._newest_first(soup.find_all('a', class_='directory'),
+                                            lambda link: link.text):
             if year_link.text.strip('[]') != '..':
-                year_url = urljoin(self.BASE_URL, year_link['href'])
-                tasks.append(
-                    self._get_edexcel_year_details(session, year_url)
-                )
-
-        results = await asyncio.gather(*tasks)
-
-        all_pdfs = {}
-        for r in results:
-            all_pdfs.update(r)
-        return all_pdfs
+                years.append(('edexcel_year', urljoin(self.BASE_URL, year_link['href'])))
+        return {}, years
 
-    async def _get_edexcel_year_details(self, session: aiohttp.ClientSession,
-                                        year_url: str) -> Dict[str, str]:
-        """Helper to fetch PDFs from an Edexcel year and its subdirectories."""
-        pdfs = await self._get_pdfs_from_xtremepapers_page(session, year_url)
-
-        # Check for qp/ms subdirs
-        html = await self._fetch_html(session, year_url)
-        if not html:
-            return pdfs
+    async def _visit_edexcel_year(self, session: aiohttp.ClientSession, year_url: str,
+                                  ctx: CrawlContext):
+        """Collect PDFs of an Edexcel year and queue its qp/ms subdirectories."""
+        soup = await self._fetch_soup(session, year_url, ctx)
+        if soup is None:
+            return {}, []
 
-        soup = BeautifulSoup(html, 'html.parser')
-        sub_tasks = []
+        sub_dirs = []
         for sub_dir_name in ['[Question-paper]', '[Mark-scheme]']:
             sub_link = soup.find('a', class_='directory', string=sub_dir_name)
             if sub_link:
-                sub_url = urljoin(self.BASE_URL, sub_link['href'])
-                sub_tasks.append(
-                    self._get_pdfs_from_xtremepapers_page(session, sub_url)
-                )
-
-        if sub_tasks:
-            sub_results = await asyncio.gather(*sub_tasks)
-            for sr in sub_results:
-                pdfs.update(sr)
+                sub_dirs.append(('xtremepapers', urljoin(self.BASE_URL, sub_link['href'])))
+        return self._parse_xtremepapers_pdfs(soup), sub_dirs
 
-        return pdfs
-
-    async def _get_pdfs_from_xtremepapers_page(self, session: aiohttp.ClientSession,
-                                               url: str) -> Dict[str, str]:
-        """Fetch all PDF links from a specific xtremepapers page."""
-        html = await self._fetch_html(session, url)
-        if not html:
-            return {}
-
-        soup = BeautifulSoup(html, 'html.parser')
+    def _parse_xtremepapers_pdfs(self, soup: BeautifulSoup) -> Dict[str, str]:
+        """Parse all PDF links from an xtremepapers folder page."""
         pdf_links = soup.find_all('a', class_='file', href=re.compile(r'\.pdf$'))
         return {
             link.text.strip(): urljoin(self.BASE_URL, link['href'])
             for link in pdf_links
         }
 
-    async def _get_papacambridge_pdfs(self, session: aiohttp.ClientSession,
-                                      subject_url: str) -> Dict[str, str]:
-        """Fetch PDF links from papacambridge."""
-        html = await self._fetch_html(session, subject_url)
-        if not html:
-            return {}
+    async def _visit_papacambridge(self, session: aiohttp.ClientSession, subject_url: str,
+                                   ctx: CrawlContext):
+        """List the year folders of a papacambridge subject (or its PDFs)."""
+        soup = await self._fetch_soup(session, subject_url, ctx)
+        if soup is None:
+            return {}, []
 
-        soup = BeautifulSoup(html, 'html.parser')
         folders = soup.find_all('div', class_='kt-widget4__item item-folder-type')
         pdf_items = soup.find_all('div', class_='kt-widget4__item item-pdf-type')
 
         if folders and not pdf_items:
-            # Parallel fetch years
             years = self._get_papacambridge_years_internal(soup, subject_url)
-            tasks = [
-                self._get_papacambridge_session_pdfs(session, y_url)
-                for y_url in years.values()
+            return {}, [
+                ('papacambridge_session', years[name])
+                for name in self._newest_first(years, lambda name: name)
             ]
-            results = await asyncio.gather(*tasks)
 
-            all_pdfs = {}
-            for res in results:
-                all_pdfs.update(res)
-            return all_pdfs
-
-        return await self._get_papacambridge_session_pdfs(session, subject_url)
+        # A page without year folders is itself a session page
+        return self._parse_papacambridge_session_pdfs(soup, subject_url), []
+
+    async def _visit_papacambridge_session(self, session: aiohttp.ClientSession,
+                                           session_url: str, ctx: CrawlContext):
+        """Collect the PDF links of a papacambridge session page."""
+        soup = await self._fetch_soup(session, session_url, ctx)
+        if soup is None:
+            return {}, []
+        return self._parse_papacambridge_session_pdfs(soup, session_url), []
+
+    @staticmethod
+    def _newest_first(items, name_of) -> list:
+        """Order folder entries so the most recent years are crawled first."""
+        def year_of(item) -> int:
+            match = re.search(r'(?:19|20)\d{2}', name_of(item))
+            return int(match.group(0)) if match else 0
+        return sorted(items, key=year_of, reverse=True)
 
     def _get_papacambridge_years_internal(self, soup: BeautifulSoup,
                                           base_url: str) -> Dict[str, str]:
@@ -377,14 +611,9 @@ class ExamScraperService:
             years[name] = year_url
         return years
 
-    async def _get_papacambridge_session_pdfs(self, session: aiohttp.ClientSession,
-                                              session_url: str) -> Dict[str, str]:
-        """Fetch PDF links from a Papacambridge session page."""
-        html = await self._fetch_html(session, session_url)
-        if not html:
-            return {}
-
-        soup = BeautifulSoup(html, 'html.parser')
+    def _parse_papacambridge_session_pdfs(self, soup: BeautifulSoup,
+                                          session_url: str) -> Dict[str, str]:
+        """Parse PDF links from a Papacambridge session page."""
         pdfs = {}
         pdf_items = soup.find_all('div', class_='kt-widget4__item item-pdf-type')
         for item in pdf_items:
@@ -436,8 +665,67 @@ class ExamScraperService:
 
         return result
 
-    async def download_paper(self, session: aiohttp.ClientSession, url: str, filename: str) -> str:
+    async def download_paper(self, session: aiohttp.ClientSession, url: str) -> str:
         """Download a paper securely using a hash for the local path."""
+        cached = self.cached_paper_path(url)
+        if cached:
+            return cached
+        return await self.start_download(session, url).wait()
+
+    async def fetch_paper(self, session: aiohttp.ClientSession,
+                          url: str) -> Tuple[str, Dict[str, str]]:
+        """Download a paper like download_paper, also returning its upstream validators.
+
+        Validators are only known when the paper is actually downloaded, not
+        when it was already cached.
+        """
+        cached = self.cached_paper_path(url)
+        if cached:
+            return cached, {}
+        download = self.start_download(session, url)
+        return await download.wait(), download.validators
+
+    def evict_paper(self, url: str):
+        """Drop the cached copy of a paper, so the next download fetches it again."""
+        cached = self.cached_paper_path(url)
+        if cached:
+            self.blobs.unlink(cached)
+
+    async def check_paper(self, session: aiohttp.ClientSession, url: str,
+                          validators: Dict[str, str]) -> Tuple[int, Dict[str, str], Optional[int]]:
+        """Send a HEAD for a paper, conditional on validators from an earlier download.
+
+        Returns the status (304 when the paper is unchanged), the paper's
+        current validators and its size when the server reports it.
+        """
+        safe_url = self._get_safe_url(url)
+        if not safe_url:
+            raise RuntimeError(f"Untrusted URL blocked: {url}")
+        headers = self._get_headers(safe_url)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        async with self._upstream_slot():
+            self.upstream_requests += 1
+            with span('network'):
+                async with session.head(self._wire_url(safe_url), headers=headers,
+                                        allow_redirects=True,
+                                        timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+                    return (response.status, paper_validators(response.headers),
+                            None if encoded else response.content_length)
+
+    def start_download(self, session: aiohttp.ClientSession, url: str) -> InFlightDownload:
+        """Start caching a paper, or join the download already in progress.
+
+        The returned download can be streamed to a client while it is being
+        written to the cache. If the same paper is known on other mirrors, a
+        hedged request is sent to the next mirror when the first one fails or
+        is slower than its usual latency percentile; whichever answers first
+        wins and the other is cancelled.
+        """
         safe_url = self._get_safe_url(url)
         if not safe_url:
             raise RuntimeError(f"Untrusted URL blocked: {url}")
@@ -445,35 +733,133 @@ class ExamScraperService:
         # Opaque filename from URL hash to break path injection data flow
         url_hash = hashlib.sha256(safe_url.encode()).hexdigest()
         path = self.get_safe_path(f"{url_hash}.pdf")
-
-        async with self.semaphore:
-            timeout = aiohttp.ClientTimeout(total=60)
-            async with session.get(safe_url, headers=self._get_headers(safe_url),
-                                 timeout=timeout) as response:
-                if response.status == 200:
-                    with open(path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                    return path
-
-                raise RuntimeError(f"Failed to download {filename}: Status {response.status}")
+        # The paper is named by its URL, whatever the requester calls it
+        filename = unquote(os.path.basename(urlparse(safe_url).path))
+
+        download = self._downloads.get(path)
+        # A failed download is not reused: the next requester retries from scratch
+        if download is not None and download.error is None:
+            return download
+
+        download = InFlightDownload(path, self.disk)
+        self._downloads[path] = download
+        # Runs detached from the requester, so a client hanging up still fills the cache
+        download.task = asyncio.create_task(
+            self._run_download(session, safe_url, filename, url_hash, download)
+        )
+        download.task.add_done_callback(lambda _: self._forget_download(download))
+        return download
+
+    def _forget_download(self, download: InFlightDownload):
+        """Drop a settled download from the registry unless it was already replaced."""
+        if self._downloads.get(download.path) is download:
+            del self._downloads[download.path]
+
+    async def _run_download(self, session: aiohttp.ClientSession, safe_url: str,
+                            filename: str, url_hash: str, download: InFlightDownload):
+        """Fill an in-flight download, reporting any failure to its readers."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        try:
+            # Only one process downloads a given paper; the others reuse its file
+            async with shared_lock(self.state, f"download:{url_hash}"):
+                if not await self.disk.run(os.path.exists, download.path):
+                    await self._download_to(session, safe_url, filename, download)
+            await download.finish()
+        except (RuntimeError, OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error downloading {filename}: {e}")
+            await download.fail(e)
+        except asyncio.CancelledError:
+            await download.fail(RuntimeError("download cancelled"))
+            raise
+
+    async def _download_to(self, session: aiohttp.ClientSession, safe_url: str,
+                           filename: str, download: InFlightDownload):
+        """Download a paper from the fastest mirror into the download's path."""
+        alternates = [
+            alt for alt in map(self._get_safe_url, self.mirror_index.alternates(safe_url))
+            if alt
+        ]
+        # The requested URL has no head start: its host competes on latency stats too,
+        # while the cache entry stays keyed on it whichever mirror answers
+        candidates = self.mirror_stats.rank([safe_url] + alternates)
+        # Skip mirrors whose circuit is open, unless that leaves nothing to try
+        candidates = [
+            c for c in candidates if not self.breaker.is_open(urlparse(c).netloc)
+        ] or candidates
+
+        digest = hashlib.sha256()
+        try:
+            with span('network'):
+                response, source_url, owner = await self.hedged.open(session, candidates,
+                                                                     filename)
+            try:
+                # A compressed body's Content-Length is not the size readers receive
+                encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+                await download.start(None if encoded else response.content_length)
+                if source_url == safe_url:
+                    # Another mirror's validators say nothing about the requested URL
+                    download.validators = paper_validators(response.headers)
+                writer = await self.disk.open_writer(download.part_path)
+                try:
+                    with span('download'):
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            digest.update(chunk)
+                            # Readers following the part file are woken per chunk written out
+                            written = await writer.write(chunk)
+                            if written:
+                                await download.wrote(written)
+                        await download.wrote(await writer.flush())
+                except BaseException:
+                    await writer.abort()
+                    raise
+            finally:
+                await self.hedged.close(response, owner)
+
+            # Readers already have every byte, and the upstream slot is free again,
+            # while the file is synced (per the fsync policy) and stored
+            await writer.close()
+            await self.disk.run(self.blobs.store, download.part_path, download.path,
+                                digest.hexdigest(), safe_url)
+            await asyncio.to_thread(self.state.paper_add, digest.hexdigest(), safe_url, filename)
+        finally:
+            await self.disk.run(self._remove_part, download.part_path)
+
+    @staticmethod
+    def _remove_part(part_path: str):
+        """Delete a download's part file if it is still there."""
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    async def _open_mirror(self, session: aiohttp.ClientSession,
+                           url: str) -> aiohttp.ClientResponse:
+        """Open a download from one mirror and record its time to headers."""
+        host = urlparse(url).netloc
+        start = time.monotonic()
+        self.upstream_requests += 1
+        try:
+            response = await session.get(self._wire_url(url), headers=self._get_headers(url),
+                                         timeout=aiohttp.ClientTimeout(total=60))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.mirror_stats.record_failure(host)
+            self.breaker.record_failure(host)
+            raise
+
+        if response.status != 200:
+            response.release()
+            self.mirror_stats.record_failure(host)
+            if response.status in self.RETRY_STATUSES:
+                self.breaker.record_failure(host)
+            raise RuntimeError(f"{host} answered with status {response.status}")
+
+        self.mirror_stats.record(host, time.monotonic() - start)
+        self.breaker.record_success(host)
+        return response
 
     def merge_pdfs(self, file_paths: List[str], output_path: str):
         """Merge multiple PDFs into one securely."""
         # Ensure output path is safe
         safe_output_path = self.get_safe_path(os.path.basename(output_path))
-        merger = PdfWriter()
-
-        base_dir = os.path.abspath('temp_downloads')
-        for pdf in file_paths:
-            # Strong sanitization for CodeQL: only use basename
-            safe_pdf_path = os.path.join(base_dir, os.path.basename(pdf))
-            if os.path.exists(safe_pdf_path):
-                merger.append(safe_pdf_path)
-
-        with open(safe_output_path, 'wb') as f:
-            merger.write(f)
-        merger.close()
+        merge_pdf_files(file_paths, safe_output_path)
 
     async def get_pastpapers_co_subjects(self, session: aiohttp.ClientSession,
                                          exam_level: str) -> Dict[str, str]:
@@ -490,7 +876,8 @@ class ExamScraperService:
         if not html:
             return {}
 
-        entries = self._extract_nextjs_data(html)
+        with span('parse'):
+            entries = self._extract_nextjs_data(html)
         subjects = {}
         for entry in entries:
             if entry.get('isDir'):
@@ -499,32 +886,25 @@ class ExamScraperService:
                 subjects[name] = f'https://pastpapers.co/caie/{rel_path}'
         return subjects
 
-    async def _get_pastpapers_co_pdfs(self, session: aiohttp.ClientSession,
-                                     subject_url: str) -> Dict[str, str]:
-        """Recursively fetch PDF links from pastpapers.co folders."""
-        html = await self._fetch_html(session, subject_url)
+    async def _visit_pastpapers_co(self, session: aiohttp.ClientSession, folder_url: str,
+                                   ctx: CrawlContext):
+        """Collect the PDF links of a pastpapers.co folder and queue its sub-folders."""
+        html = await self._fetch_html(session, folder_url, ctx=ctx)
         if not html:
-            return {}
+            return {}, []
 
-        entries = self._extract_nextjs_data(html)
+        with span('parse'):
+            entries = self._extract_nextjs_data(html)
         pdfs = {}
-        tasks = []
-
-        for entry in entries:
+        sub_folders = []
+        for entry in self._newest_first(entries, lambda entry: entry.get('name') or ''):
             name = entry.get('name')
             rel_path = entry.get('relPath')
             if entry.get('isDir'):
-                sub_url = f'https://pastpapers.co/caie/{rel_path}'
-                tasks.append(self._get_pastpapers_co_pdfs(session, sub_url))
+                sub_folders.append(('pastpapers_co', f'https://pastpapers.co/caie/{rel_path}'))
             elif name.lower().endswith('.pdf'):
                 pdfs[name] = f'https://pastpapers.co/caie/{rel_path}'
-
-        if tasks:
-            results = await asyncio.gather(*tasks)
-            for res in results:
-                pdfs.update(res)
-
-        return pdfs
+        return pdfs, sub_folders
 
     def _parse_entries_from_payload(self, clean_p: str) -> List[dict]:
         """Helper to extract entries array from a single clean payload string."""
@@ -0,0 +1,278 @@
+"""
+State shared by every backend worker process on one host.
+Caches, upstream rate limits, download locks and popularity counters live in
+a single SQLite database (WAL mode) so `uvicorn --workers N` stays polite to
+the upstream mirrors and never corrupts or duplicates cached data.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_STATE_PATH = os.path.join('temp_downloads', 'examquest_state.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    name TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    owner TEXT,
+    expires REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, slot)
+);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS papers (
+    digest TEXT NOT NULL,
+    url TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    PRIMARY KEY (digest, url)
+);
+"""
+
+
+class StateStore:
+    """Thin thread-safe wrapper around the shared SQLite database."""
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def execute(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        """Run one statement and return all rows."""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def transaction(self, func):
+        """Run func(conn) inside an immediate (write-locked) transaction."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    # Cache
+
+    def cache_get(self, key: str, max_age: Optional[float] = None) -> Any:
+        """Return a cached JSON value, or None if missing or older than max_age."""
+        rows = self.execute('SELECT value, updated FROM cache WHERE key = ?', (key,))
+        if not rows:
+            return None
+        value, updated = rows[0]
+        if max_age is not None and time.time() - updated >= max_age:
+            return None
+        return json.loads(value)
+
+    def cache_set(self, key: str, value: Any):
+        """Store a JSON value atomically."""
+        self.execute('INSERT OR REPLACE INTO cache (key, value, updated) VALUES (?, ?, ?)',
+                     (key, json.dumps(value), time.time()))
+
+    def import_json_cache(self, json_path: str):
+        """Import entries from the legacy subject_cache.json file once."""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            os.replace(json_path, f"{json_path}.imported")
+        except (OSError, json.JSONDecodeError):
+            # Missing, unreadable, or already imported by another worker
+            return
+        for key, value in legacy.items():
+            if self.cache_get(key) is None:
+                self.cache_set(key, value)
+
+    # Leases
+
+    def try_acquire_slot(self, name: str, slots: int, owner: str, lease: float) -> bool:
+        """Claim one of `slots` free or expired slots of a named limiter."""
+        def claim(conn):
+            now = time.time()
+            conn.executemany('INSERT OR IGNORE INTO slots (name, slot) VALUES (?, ?)',
+                             [(name, i) for i in range(slots)])
+            row = conn.execute(
+                'SELECT slot FROM slots WHERE name = ? AND slot < ? '
+                'AND (owner IS NULL OR expires < ?) LIMIT 1',
+                (name, slots, now)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute('UPDATE slots SET owner = ?, expires = ? WHERE name = ? AND slot = ?',
+                         (owner, now + lease, name, row[0]))
+            return True
+        return self.transaction(claim)
+
+    def release_slot(self, name: str, owner: str):
+        """Give back the slot held by owner."""
+        self.execute('UPDATE slots SET owner = NULL, expires = 0 WHERE name = ? AND owner = ?',
+                     (name, owner))
+
+    def try_lock(self, name: str, owner: str, lease: float) -> bool:
+        """Take (or renew) a named lock unless another live owner holds it."""
+        def claim(conn):
+            now = time.time()
+            row = conn.execute('SELECT owner, expires FROM locks WHERE name = ?',
+                               (name,)).fetchone()
+            if row and row[0] != owner and row[1] >= now:
+                return False
+            conn.execute('INSERT OR REPLACE INTO locks (name, owner, expires) VALUES (?, ?, ?)',
+                         (name, owner, now + lease))
+            return True
+        return self.transaction(claim)
+
+    def unlock(self, name: str, owner: str):
+        """Release a named lock held by owner."""
+        self.execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+
+    # Counters
+
+    _COUNTER_ADD = ('INSERT INTO counters (kind, key, count) VALUES (?, ?, ?) '
+                    'ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count')
+
+    def counter_add(self, kind: str, key: str, amount: int = 1):
+        """Increment a popularity counter."""
+        self.execute(self._COUNTER_ADD, (kind, key, amount))
+
+    def counter_add_many(self, amounts: Dict[Tuple[str, str], int]):
+        """Increment several counters, keyed by (kind, key), in one transaction."""
+        rows = [(kind, key, amount) for (kind, key), amount in amounts.items()]
+        self.transaction(lambda conn: conn.executemany(self._COUNTER_ADD, rows))
+
+    def counter_top(self, kind: str, limit: int) -> List[Tuple[str, int]]:
+        """Return the highest counters of a kind."""
+        return self.execute('SELECT key, count FROM counters WHERE kind = ? '
+                            'ORDER BY count DESC LIMIT ?', (kind, limit))
+
+    def counter_decay(self, kind: str):
+        """Halve every counter of a kind and drop the ones reaching zero."""
+        self.execute('UPDATE counters SET count = count / 2 WHERE kind = ?', (kind,))
+        self.execute('DELETE FROM counters WHERE kind = ? AND count <= 0', (kind,))
+
+    # Papers
+
+    def paper_add(self, digest: str, url: str, filename: str):
+        """Record that the file with this content hash was downloaded from url."""
+        self.execute('INSERT OR REPLACE INTO papers (digest, url, filename) VALUES (?, ?, ?)',
+                     (digest, url, filename))
+
+    def paper_names(self, digest: str) -> List[Tuple[str, str]]:
+        """Return the (url, filename) pairs a stored file was downloaded as."""
+        return self.execute('SELECT url, filename FROM papers WHERE digest = ? ORDER BY url',
+                            (digest,))
+
+
+async def _in_thread(func, *args):
+    """Run a store call off the event loop; it completes even if the caller is cancelled."""
+    await asyncio.shield(asyncio.to_thread(func, *args))
+
+
+async def _poll(attempt, max_wait: float = 0.25):
+    """Retry a non-blocking acquire with growing sleeps until it succeeds."""
+    delay = 0.01
+    while not await asyncio.to_thread(attempt):
+        await asyncio.sleep(delay)
+        delay = min(max_wait, delay * 2)
+
+
+class SharedSemaphore:
+    """Semaphore whose permits are shared by all worker processes.
+
+    A local semaphore queues this process' tasks first, so only tasks that
+    already own a local permit poll the database for a global slot. It is an
+    asyncio.Semaphore unless another one with acquire()/release()/locked()
+    (such as a priority scheduler) is given. Slots are leased, so permits of a
+    crashed worker come back on their own.
+    """
+
+    def __init__(self, store: StateStore, name: str, slots: int, lease: float = 300,
+                 local=None):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.store = store
+        self.name = name
+        self.slots = slots
+        self.lease = lease
+        self._local = local or asyncio.Semaphore(slots)
+        self._held = contextvars.ContextVar(f'shared_semaphore_{name}', default=())
+
+    async def acquire(self, wait: bool = True) -> str:
+        """Take a permit and return the owner to release it as.
+
+        Without wait, returns "" instead of queueing when no permit is free now.
+        """
+        if not wait and self._local.locked():
+            return ""
+        await self._local.acquire()
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+
+        def claim() -> bool:
+            return self.store.try_acquire_slot(self.name, self.slots, owner, self.lease)
+
+        try:
+            if wait:
+                await _poll(claim)
+            elif not await asyncio.to_thread(claim):
+                self._local.release()
+                return ""
+        except BaseException:
+            # A cancelled poll may still have claimed the slot in its thread
+            self.store.release_slot(self.name, owner)
+            self._local.release()
+            raise
+        return owner
+
+    async def release(self, owner: str):
+        """Give back the permit taken as owner."""
+        try:
+            # Shielded so a cancelled task cannot leak its slot
+            await _in_thread(self.store.release_slot, self.name, owner)
+        finally:
+            self._local.release()
+
+    async def __aenter__(self):
+        owner = await self.acquire()
+        self._held.set(self._held.get() + (owner,))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        held = self._held.get()
+        self._held.set(held[:-1])
+        await self.release(held[-1])
+
+
+@asynccontextmanager
+async def shared_lock(store: StateStore, name: str, lease: float = 300):
+    """Hold a named lock across all worker processes."""
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    try:
+        await _poll(lambda: store.try_lock(name, owner, lease))
+        yield
+    finally:
+        await _in_thread(store.unlock, name, owner)
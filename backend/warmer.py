@@ -0,0 +1,201 @@
+"""
+Background cache warmer for popular subjects.
+Tracks which subjects (and papers) users ask for and pre-crawls the most
+popular /papers listings during quiet periods, within an upstream budget.
+Popularity and activity are counted in memory, flushed to the shared state
+store every second, and only the worker holding the leader lease warms, so N
+workers do not warm N times.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, List, Tuple
+
+import aiohttp
+
+try:
+    from backend.crawl import CrawlContext
+    from backend.scheduler import Priority, work_context
+except ImportError:
+    from crawl import CrawlContext
+    from scheduler import Priority, work_context
+
+logger = logging.getLogger(__name__)
+
+# (source, board, subject_url)
+SubjectKey = Tuple[str, str, str]
+
+
+class CacheWarmer:
+    # pylint: disable=too-many-instance-attributes
+    """Pre-crawl the top N subject listings and optionally the most downloaded PDFs."""
+
+    FAVORITE_WEIGHT = 3
+
+    def __init__(self, service, warm_listing: Callable[..., Awaitable[bool]],
+                 top_n: int = 10, budget: int = 200, budget_window: float = 3600,
+                 quiet_seconds: float = 30, interval: float = 60, warm_pdfs: int = 0,
+                 flush_interval: float = 1):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.service = service
+        self.warm_listing = warm_listing
+        self.top_n = top_n
+        self.budget = budget
+        self.budget_window = budget_window
+        self.quiet_seconds = quiet_seconds
+        self.interval = interval
+        self.warm_pdfs = warm_pdfs
+        self.flush_interval = flush_interval
+
+        self.state = service.state
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        # Written to the store by flush(), so requests never wait for it
+        self._counts = Counter()
+        self._last_activity = 0.0
+        self._flushed_activity = 0.0
+        self._window_start = time.monotonic()
+        self._spent = 0
+
+    def note_activity(self):
+        """Mark that a user request is being served (the warmer backs off)."""
+        self._last_activity = time.time()
+
+    def record_subject(self, source: str, board: str, subject_url: str, weight: int = 1):
+        """Count a /papers request for a subject."""
+        self._counts['subjects', json.dumps([source, board, subject_url])] += weight
+
+    def record_favorites(self, favorites: List[dict]):
+        """Count the favorites a frontend reports, weighted above single visits."""
+        for fav in favorites:
+            subject_url = fav.get("subject_url")
+            if subject_url:
+                self.record_subject(fav.get("source", ""), fav.get("board", ""),
+                                    subject_url, self.FAVORITE_WEIGHT)
+
+    def record_download(self, url: str, filename: str):
+        """Count a paper download."""
+        self._counts['downloads', json.dumps([url, filename])] += 1
+
+    def _take_unflushed(self) -> Tuple[Counter, float]:
+        """Return and reset the counts and the activity not written to the store yet."""
+        counts, self._counts = self._counts, Counter()
+        activity = self._last_activity if self._last_activity > self._flushed_activity else 0
+        self._flushed_activity = max(self._flushed_activity, activity)
+        return counts, activity
+
+    def _write(self, counts: Counter, activity: float):
+        if counts:
+            self.state.counter_add_many(counts)
+        if activity:
+            self.state.cache_set('warmer:last_activity', activity)
+
+    async def flush(self):
+        """Write the counts and the latest activity gathered since the last flush."""
+        # Taken on the event loop, so no request counts into a batch being written
+        await asyncio.to_thread(self._write, *self._take_unflushed())
+
+    async def flush_periodically(self):
+        """Flush every flush_interval until the task is cancelled, then once more."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            self._write(*self._take_unflushed())
+
+    def top_subjects(self) -> List[SubjectKey]:
+        """Return the most requested subjects, most popular first."""
+        return [tuple(json.loads(key)) for key, _ in self.state.counter_top('subjects',
+                                                                            self.top_n)]
+
+    def top_downloads(self) -> List[Tuple[str, str]]:
+        """Return the (url, filename) of the most downloaded papers."""
+        return [tuple(json.loads(key)) for key, _ in self.state.counter_top('downloads',
+                                                                            self.warm_pdfs)]
+
+    def remaining_budget(self) -> int:
+        """Return the upstream requests left in the current budget window."""
+        now = time.monotonic()
+        if now - self._window_start >= self.budget_window:
+            self._window_start = now
+            self._spent = 0
+            self._decay()
+        return max(0, self.budget - self._spent)
+
+    def _decay(self):
+        """Halve all counters so popularity follows recent demand."""
+        self.state.counter_decay('subjects')
+        self.state.counter_decay('downloads')
+
+    def _is_quiet(self) -> bool:
+        last_activity = max(self._last_activity,
+                            self.state.cache_get('warmer:last_activity') or 0)
+        return time.time() - last_activity >= self.quiet_seconds
+
+    def _lead(self) -> bool:
+        """Take or renew the leader lease; it outlives one interval."""
+        return self.state.try_lock('warmer:leader', self._owner, self.interval * 3)
+
+    async def _may_warm(self) -> bool:
+        """Return whether another item may be warmed, renewing the lease if so."""
+        return await asyncio.to_thread(
+            lambda: self._is_quiet() and self.remaining_budget() > 0 and self._lead())
+
+    async def _warm_subject(self, session: aiohttp.ClientSession, subject: SubjectKey) -> bool:
+        """Crawl a subject listing within the remaining budget and charge what it sent."""
+        # The crawl stops sending requests once it has spent the budget
+        ctx = CrawlContext(budget=self.remaining_budget())
+        try:
+            return await self.warm_listing(session, *subject, ctx)
+        finally:
+            # Only the crawl's own requests: users served meanwhile are not charged
+            self._spent += ctx.upstream_requests
+
+    async def warm_once(self, session: aiohttp.ClientSession) -> int:
+        """Run one warming pass and return the number of items warmed."""
+        warmed = 0
+        await self.flush()
+        for subject in await asyncio.to_thread(self.top_subjects):
+            if not await self._may_warm():
+                return warmed
+            if await self._warm_subject(session, subject):
+                warmed += 1
+
+        downloads = await asyncio.to_thread(self.top_downloads) if self.warm_pdfs else []
+        for url, _ in downloads:
+            if not await self._may_warm():
+                return warmed
+            if self.service.cached_paper_path(url):
+                continue
+            # A download is one request, unless it has to hedge or fall back
+            self._spent += 1
+            try:
+                await self.service.download_paper(session, url)
+                warmed += 1
+            except (RuntimeError, OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Prefetch of %s failed: %s", url, e)
+        return warmed
+
+    async def run(self, session: aiohttp.ClientSession):
+        """Warm caches every interval until the task is cancelled."""
+        # Warming only takes upstream slots that no user request is waiting for
+        with work_context(Priority.PREFETCH, 'warmer'):
+            await self._run(session)
+
+    async def _run(self, session: aiohttp.ClientSession):
+        while True:
+            await asyncio.sleep(self.interval)
+            # The leader keeps the lease by renewing it every pass and between items
+            if not await asyncio.to_thread(self._lead):
+                continue
+            try:
+                warmed = await self.warm_once(session)
+                if warmed:
+                    logger.info("Cache warmer refreshed %d item(s), %d request(s) left",
+                                warmed, self.remaining_budget())
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error("Cache warming failed: %s", e, exc_info=True)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import axios from 'axios';
 import {
     Search,
@@ -23,7 +23,8 @@ import {
 import { motion, AnimatePresence } from 'framer-motion';
 import { getSubjectIcon } from './components/SubjectIcons';
 
-const API_BASE = 'http://localhost:8000';
+// Production builds are served by the backend itself and call it on the same origin
+const API_BASE = import.meta.env.VITE_API_BASE ?? 'http://localhost:8000';
 
 const SkeletonCard = () => (
     <div className="card animate-shimmer">
@@ -48,6 +49,7 @@ function App() {
     const [loading, setLoading] = useState(false);
     const [selectedSubject, setSelectedSubject] = useState(null);
     const [papers, setPapers] = useState([]);
+    const papersStream = useRef(null);
     const [mobileMenuOpen, setMobileMenuOpen] = useState(false);
     const [favorites, setFavorites] = useState(() => {
         const saved = localStorage.getItem('exam_favorites');
@@ -61,6 +63,16 @@ function App() {
 
     useEffect(() => {
         localStorage.setItem('exam_favorites', JSON.stringify(favorites));
+        if (favorites.length > 0) {
+            // Let the backend warm the paper listings of bookmarked subjects
+            axios.post(`${API_BASE}/favorites`, {
+                favorites: favorites.map(fav => ({
+                    subject_url: fav.url,
+                    board: fav.board?.board,
+                    source: fav.board?.source
+                }))
+            }).catch(() => {});
+        }
     }, [favorites]);
 
     const fetchBoards = async () => {
@@ -112,21 +124,52 @@ function App() {
     const fetchPapers = async (subject, boardOverride = null) => {
         setSelectedSubject(subject);
         setSearchQuery(''); // Reset search when viewing a specific subject
+        setPapers([]);
         setLoading(true);
+        // Stop a listing that is still streaming for a previously opened subject
+        papersStream.current?.abort();
+        const controller = new AbortController();
+        papersStream.current = controller;
         try {
             const board = boardOverride || selectedBoard;
-            const res = await axios.get(`${API_BASE}/papers`, {
-                params: {
-                    subject_url: subject.url,
-                    board: board.board,
-                    source: board.source
-                }
+            const params = new URLSearchParams({
+                subject_url: subject.url,
+                board: board.board,
+                source: board.source
             });
-            setPapers(res.data);
+            // NDJSON stream: papers of the newest years arrive while older ones are crawled
+            const res = await fetch(`${API_BASE}/papers/stream?${params}`, {
+                signal: controller.signal
+            });
+            if (!res.ok) {
+                throw new Error(`Failed to load papers: ${res.status}`);
+            }
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            for (;;) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                const batch = lines
+                    .filter(line => line.trim())
+                    .map(line => JSON.parse(line))
+                    .filter(record => !record.done);
+                if (batch.length > 0) {
+                    setPapers(prev => [...prev, ...batch]);
+                    setLoading(false);
+                }
+            }
         } catch (err) {
-            console.error(err);
+            if (err.name !== 'AbortError') {
+                console.error(err);
+            }
         } finally {
-            setLoading(false);
+            if (papersStream.current === controller) {
+                setLoading(false);
+            }
         }
     };
 
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Load test for the ExamQuest backend.
+Starts a fake upstream mirror and a backend whose upstream requests are sent to
+it, then ramps virtual users through browse -> download -> merge flows and
+reports throughput, latency percentiles, error rates and event-loop lag, per
+stage and per endpoint. Results can be saved as JSON and compared between
+versions with --baseline. Each virtual user is a distinct client of the
+backend's fair queuing, reported through X-Forwarded-For by a trusted proxy.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from pypdf import PdfWriter
+
+from backend.metrics import percentile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BOARD, LEVEL = 'CAIE', 'A Level'
+
+
+def build_pdf(pages: int) -> bytes:
+    """Return a minimal PDF document with blank pages."""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class FakeMirror:
+    """Local stand-in for xtremepapers, served on its own thread and event loop."""
+
+    def __init__(self, port: int, subjects: int, papers: int, latency: float, pdf_pages: int):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.port = port
+        self.subjects = subjects
+        self.papers = papers
+        self.latency = latency
+        self.pdf = build_pdf(pdf_pages)
+        self.requests = 0
+
+    def _subject_code(self, index: int) -> str:
+        return str(9001 + index)
+
+    def _index_page(self) -> str:
+        links = ''.join(
+            f'<a class="directory" href="index.php?dirpath=./{BOARD}/A+Level/'
+            f'Subject+{i:02d}+({self._subject_code(i)})/&order=0">'
+            f'[Subject {i:02d} ({self._subject_code(i)})]</a>'
+            for i in range(self.subjects)
+        )
+        return f'<html><body><a class="directory" href="index.php">[..]</a>{links}</body></html>'
+
+    def _subject_page(self, code: str) -> str:
+        names = []
+        for i in range(self.papers):
+            season, kind = 'sw'[i % 2], ('qp', 'ms')[i // 2 % 2]
+            names.append(f'{code}_{season}{10 + i // 8}_{kind}_{i // 4 % 2 + 1}.pdf')
+        links = ''.join(f'<a class="file" href="papers/{code}/{name}">{name}</a>'
+                        for name in names)
+        return f'<html><body>{links}</body></html>'
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Serve listing pages and PDFs after a simulated network latency."""
+        self.requests += 1
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        tail = request.match_info['tail']
+        if tail.endswith('.pdf'):
+            return web.Response(body=self.pdf, content_type='application/pdf')
+        dirpath = request.query.get('dirpath', '')
+        if dirpath.rstrip('/') == f'./{BOARD}/{LEVEL}':
+            return web.Response(text=self._index_page(), content_type='text/html')
+        if dirpath.endswith(')/'):
+            code = dirpath.rstrip(')/').rsplit('(', 1)[-1]
+            return web.Response(text=self._subject_page(code), content_type='text/html')
+        return web.Response(status=404)
+
+    def start(self):
+        """Serve in a daemon thread, so the load generator's loop is not shared."""
+        ready = threading.Event()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get('/{host}/{tail:.*}', self.handle)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', self.port).start()
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait(10)
+
+
+def start_backend(args, mirror_url: str, workdir: str) -> subprocess.Popen:
+    """Start uvicorn on a scratch directory with upstream traffic sent to the fake mirror."""
+    env = dict(os.environ,
+               EXAMQUEST_UPSTREAM_OVERRIDE=mirror_url,
+               EXAMQUEST_JITTER_MIN=str(args.jitter_min),
+               EXAMQUEST_JITTER_MAX=str(args.jitter_max),
+               EXAMQUEST_WARMER='0',
+               EXAMQUEST_INDEX='0',
+               # The harness poses as a proxy in front of its virtual users
+               EXAMQUEST_TRUSTED_PROXIES='127.0.0.1')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app',
+         '--app-dir', os.path.join(REPO_DIR, 'backend'),
+         '--port', str(args.port), '--workers', str(args.workers), '--log-level', 'warning'],
+        cwd=workdir, env=env
+    )
+
+
+async def wait_for_backend(client: aiohttp.ClientSession, base: str, timeout: float = 60):
+    """Poll /health until the backend answers."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with client.get(f'{base}/health') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend at {base} did not become ready")
+
+
+class StageStats:
+    """Latencies and errors of one stage, by endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def call(self, endpoint: str, request) -> Optional[bytes]:
+        """Time one request until its body is read; return the body or None on error."""
+        start = time.monotonic()
+        body = None
+        try:
+            async with request as response:
+                data = await response.read()
+                if response.status < 400:
+                    body = data
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        self.latencies.setdefault(endpoint, []).append(time.monotonic() - start)
+        if body is None:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return body
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        """Return throughput, latency percentiles (ms) and error rate per endpoint."""
+        result = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            result[endpoint] = {
+                'requests': len(samples),
+                'rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(samples, 0.5) * 1000, 1),
+                'p95_ms': round(percentile(samples, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(samples, 0.99) * 1000, 1),
+                'error_rate': round(self.errors.get(endpoint, 0) / len(samples), 4),
+            }
+        return result
+
+
+async def user_flow(client: aiohttp.ClientSession, base: str, stats: StageStats,
+                    rand: random.Random, think: float, headers: Dict[str, str]):
+    """Browse to a subject, download a few of its papers and merge some."""
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    await stats.call('GET /boards', client.get(f'{base}/boards', headers=headers))
+    body = await stats.call('GET /subjects', client.get(
+        f'{base}/subjects', params={'source': 'xtremepapers', 'board': BOARD, 'level': LEVEL},
+        headers=headers))
+    if not body:
+        return
+    subject = rand.choice(json.loads(body))
+    body = await stats.call('GET /papers', client.get(
+        f'{base}/papers',
+        params={'subject_url': subject['url'], 'board': BOARD, 'source': 'xtremepapers'},
+        headers=headers))
+    if not body:
+        return
+    papers = json.loads(body)
+    for paper in rand.sample(papers, min(len(papers), rand.randint(1, 3))):
+        await stats.call('GET /download', client.get(
+            f'{base}/download', params={'url': paper['url'], 'filename': paper['name']},
+            headers=headers))
+        await asyncio.sleep(rand.uniform(0, 2 * think))
+    selected = rand.sample(papers, min(len(papers), rand.randint(2, 4)))
+    await stats.call('POST /merge', client.post(f'{base}/merge', json={'papers': selected},
+                                                headers=headers))
+
+
+def client_headers(user: int, shared_client: bool) -> Dict[str, str]:
+    """Return the headers that make a virtual user a client of its own."""
+    if shared_client:
+        return {}
+    return {'X-Forwarded-For': f'10.{user >> 16 & 255}.{user >> 8 & 255}.{user & 255}'}
+
+
+async def virtual_user(client: aiohttp.ClientSession, base: str, stats: StageStats,
+                       stop_at: float, think: float, headers: Dict[str, str]):
+    """Repeat the user flow, with think time between flows, until stop_at."""
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    rand = random.Random()
+    while time.monotonic() < stop_at:
+        await user_flow(client, base, stats, rand, think, headers)
+        await asyncio.sleep(rand.uniform(0, 2 * think))
+
+
+async def run_stage(client: aiohttp.ClientSession, base: str, users: int, args) -> dict:
+    """Run `users` virtual users for one stage and collect the results."""
+    duration = args.stage_seconds
+    stats = StageStats()
+    start = time.monotonic()
+    stop_at = start + duration
+    tasks = [asyncio.create_task(virtual_user(client, base, stats, stop_at, args.think,
+                                              client_headers(user, args.shared_client)))
+             for user in range(users)]
+    # Users finish the request they are in; a stuck one is cut off after a grace period
+    _, stuck = await asyncio.wait(tasks, timeout=duration + 60)
+    for task in stuck:
+        task.cancel()
+    elapsed = time.monotonic() - start
+
+    async with client.get(f'{base}/metrics', params={'window': elapsed}) as response:
+        metrics = await response.json()
+    return {
+        'users': users,
+        'seconds': round(elapsed, 1),
+        'endpoints': stats.report(elapsed),
+        'event_loop_lag': metrics['event_loop_lag'],
+        # Over the worker's latest merges, which may predate the stage
+        'merge_peak_rss_mb': round(max((merge['peak_rss_bytes'] or 0
+                                        for merge in metrics['merges']), default=0) / 2 ** 20, 1),
+    }
+
+
+def print_stage(stage: dict, baseline: Optional[dict] = None):
+    """Print one stage as a table, with changes against a baseline stage if given."""
+    lag = stage['event_loop_lag']
+    print(f"\n== {stage['users']} user(s), {stage['seconds']} s — event-loop lag "
+          f"p50 {lag['p50_ms']} ms, p95 {lag['p95_ms']} ms, p99 {lag['p99_ms']} ms, "
+          f"max {lag['max_ms']} ms, merge peak RSS {stage.get('merge_peak_rss_mb', 0)} MB")
+    print(f"{'endpoint':<16}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+          + ('   vs baseline' if baseline else ''))
+    for endpoint, row in stage['endpoints'].items():
+        line = (f"{endpoint:<16}{row['rps']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                f"{row['p99_ms']:>10}{row['error_rate']:>9.1%}")
+        before = (baseline or {}).get('endpoints', {}).get(endpoint)
+        if before:
+            line += (f"   req/s {row['rps'] - before['rps']:+.2f}, "
+                     f"p95 {row['p95_ms'] - before['p95_ms']:+.1f} ms")
+        print(line)
+
+
+async def load_test(args) -> List[dict]:
+    """Ramp through the configured user counts and return the results of each stage."""
+    base = args.url or f'http://127.0.0.1:{args.port}'
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as client:
+        await wait_for_backend(client, base)
+        return [await run_stage(client, base, users, args)
+                for users in args.users]
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Load test the ExamQuest backend.")
+    parser.add_argument("--users", type=lambda s: [int(n) for n in s.split(',')],
+                        default=[1, 5, 10, 25, 50],
+                        help="comma-separated virtual users per stage (default: 1,5,10,25,50)")
+    parser.add_argument("--stage-seconds", type=float, default=30, help="duration of each stage")
+    parser.add_argument("--think", type=float, default=0.5,
+                        help="mean pause of a user between actions, in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765, help="port of the started backend")
+    parser.add_argument("--url", help="test an already running backend instead of starting one "
+                                      "(start it with EXAMQUEST_UPSTREAM_OVERRIDE set to the "
+                                      "fake mirror URL and EXAMQUEST_TRUSTED_PROXIES to this "
+                                      "host's address)")
+    parser.add_argument("--shared-client", action="store_true",
+                        help="send every user's requests as one client, to measure the "
+                             "per-client queue limit instead of capacity")
+    parser.add_argument("--mirror-port", type=int, default=8766, help="port of the fake mirror")
+    parser.add_argument("--mirror-latency", type=float, default=0.2,
+                        help="mean response delay of the fake mirror, in seconds")
+    parser.add_argument("--subjects", type=int, default=20, help="subjects on the fake mirror")
+    parser.add_argument("--papers", type=int, default=40, help="papers per subject")
+    parser.add_argument("--pdf-pages", type=int, default=4, help="pages per fake paper")
+    parser.add_argument("--jitter-min", type=float, default=0.0,
+                        help="backend politeness jitter minimum (production: 0.5)")
+    parser.add_argument("--jitter-max", type=float, default=0.0,
+                        help="backend politeness jitter maximum (production: 2.0)")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --json")
+    return parser.parse_args()
+
+
+def main():
+    """Entry point for the load test."""
+    args = parse_args()
+    mirror = FakeMirror(args.mirror_port, args.subjects, args.papers,
+                        args.mirror_latency, args.pdf_pages)
+    mirror.start()
+    mirror_url = f'http://127.0.0.1:{args.mirror_port}'
+
+    with tempfile.TemporaryDirectory(prefix='examquest-load-') as workdir:
+        backend = None if args.url else start_backend(args, mirror_url, workdir)
+        try:
+            stages = asyncio.run(load_test(args))
+        finally:
+            if backend:
+                backend.terminate()
+                backend.wait(timeout=30)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = {stage['users']: stage for stage in json.load(f)['stages']}
+    for stage in stages:
+        print_stage(stage, baseline.get(stage['users']))
+    print(f"\nFake mirror served {mirror.requests} upstream request(s)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'stages': stages}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,23 @@
 This script downloads exam papers and mark schemes from xtremepapers,
 papacambridge, and pastpapers.co websites for CAIE and Edexcel boards
 and organizes them into directories based on the exam board and subject.
+Re-running it for a subject syncs incrementally: a manifest in the subject's
+folder records what was downloaded, so unchanged papers are skipped after a
+conditional HEAD and only new or changed ones are fetched.
 """
 import os
+import argparse
 import asyncio
 import aiohttp
+from backend.crawl import CrawlContext
+from backend.manifest import SyncManifest, file_sha256
 from backend.scraper_service import ExamScraperService
 
 service = ExamScraperService()
 
+# Outcomes of syncing a paper, and how they are marked in the summary
+SYNC_MARKS = {'new': '+', 'updated': '~', 'restored': '*', 'removed': '-', 'failed': '!'}
+
 def get_exam_board():
     """Prompt user to choose the examination board."""
     while True:
@@ -81,43 +90,136 @@ async def get_exam_info(session: aiohttp.ClientSession):
         'subjects': subjects
     }
 
-async def download_pdf_to_dir(session, url, filename, subject_dir, exam_board):
-    """Refactored download helper for CLI."""
-    try:
-        # We reuse the logic but save it to the desired directory structure
-        temp_path = await service.download_paper(session, url, filename)
-        subdir = service.categorize_pdf(filename, exam_board)
-        dir_path = os.path.join(subject_dir, subdir)
-        os.makedirs(dir_path, exist_ok=True)
-        final_path = os.path.join(dir_path, filename)
-        os.replace(temp_path, final_path)
-        print(f"Downloaded: {filename}")
+def is_intact(path, entry, verify):
+    """Check that a synced paper is still on disk as it was recorded."""
+    if not os.path.isfile(path) or os.path.getsize(path) != entry['size']:
+        return False
+    return not verify or file_sha256(path) == entry['sha256']
+
+def changed_upstream(status, validators, size, entry):
+    """Decide from a paper's HEAD response whether it changed since it was synced."""
+    if status == 304:
+        return False
+    if status != 200:
+        # e.g. HEAD not allowed: only downloading the paper can tell
         return True
-    except (IOError, OSError) as e:
+    for key in ('etag', 'last_modified'):
+        if entry[key] and validators.get(key):
+            return validators[key] != entry[key]
+    return size is None or size != entry['size']
+
+async def sync_pdf(session, manifest, filename, url, exam_board, options):
+    """Bring one paper of a subject up to date and return how it changed."""
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    final_path = os.path.join(manifest.subject_dir,
+                              service.categorize_pdf(filename, exam_board), filename)
+    if filename not in manifest.papers and os.path.isfile(final_path):
+        # Downloaded before this subject had a manifest: check it like a synced paper
+        manifest.record(filename, url, final_path, {})
+    entry = manifest.papers.get(filename)
+    try:
+        intact = entry is not None and is_intact(manifest.local_path(filename), entry,
+                                                 options.verify)
+        if intact and entry['url'] == url and not options.full:
+            if options.no_check:
+                return 'unchanged'
+            status, validators, size = await service.check_paper(session, url, entry)
+            if not changed_upstream(status, validators, size, entry):
+                entry.update(validators)
+                return 'unchanged'
+        if entry is not None or options.full:
+            # The cached copy is no fresher than the local one
+            service.evict_paper(url)
+        if entry is not None and not intact:
+            # A copy edited in place damaged the stored file it is linked to
+            service.blobs.discard(entry['sha256'], manifest.local_path(filename))
+        temp_path, validators = await service.fetch_paper(session, url)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # Hard link to the cached copy, so papers shared between sources use disk once
+        service.blobs.link(temp_path, final_path)
+        manifest.record(filename, url, final_path, validators)
+    except (IOError, OSError, RuntimeError, aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"Error downloading {filename}: {e}")
-        return False
+        return 'failed'
+
+    print(f"Downloaded: {filename}")
+    if entry is None:
+        return 'new'
+    if not intact:
+        return 'restored'
+    return 'unchanged' if manifest.papers[filename]['sha256'] == entry['sha256'] else 'updated'
+
+def print_sync_summary(subject, changes):
+    """Print how many papers of a subject changed, then each change."""
+    counts = ", ".join(f"{len(changes[status])} {status}" for status in
+                       ('new', 'updated', 'restored', 'unchanged', 'failed'))
+    print(f"\nCompleted {subject}: {counts}, {len(changes['removed'])} removed upstream")
+    for status, mark in SYNC_MARKS.items():
+        for filename in changes[status]:
+            print(f"  {mark} {filename}")
+    if changes['removed']:
+        print("Papers removed upstream are kept locally.")
+
+async def sync_subject(session, subject, pdfs, subject_dir, exam_board, options, complete):
+    """Sync the PDFs of a subject into its directory and print what changed.
 
-async def download_selected_pdfs(session, subject, pdfs, subject_dir, exam_board):
-    """Download PDFs for a selected subject."""
-    successful_downloads = 0
-    total_pdfs = len(pdfs)
+    Papers are only reported as removed upstream when the listing is complete.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    manifest = SyncManifest(subject_dir)
+    manifest.load()
+    changes = {status: [] for status in (*SYNC_MARKS, 'unchanged')}
+    if complete:
+        changes['removed'] = sorted(set(manifest.papers) - set(pdfs))
+        for filename in changes['removed']:
+            del manifest.papers[filename]
 
-    for filename, pdf_url in pdfs.items():
-        if await download_pdf_to_dir(session, pdf_url, filename, subject_dir, exam_board):
-            successful_downloads += 1
-        await asyncio.sleep(0.5)
+    try:
+        for filename, pdf_url in pdfs.items():
+            requests_before = service.upstream_requests
+            changes[await sync_pdf(session, manifest, filename, pdf_url, exam_board,
+                                   options)].append(filename)
+            # Politeness delay only after papers that needed upstream requests
+            if service.upstream_requests != requests_before:
+                await asyncio.sleep(0.5)
+    finally:
+        # Saved even when interrupted, so the next run resumes where this one stopped
+        manifest.save()
+
+    print_sync_summary(subject, changes)
+    return changes
 
-    print(f"\nCompleted {subject}: {successful_downloads} out of {total_pdfs} "
-          f"files downloaded successfully")
-    return successful_downloads
+async def fetch_subject(session, exam_info, subject, subject_url):
+    """Crawl a subject's papers and create its directory.
+
+    Returns the papers, the directory and whether the listing is complete,
+    or None if the subject has no papers.
+    """
+    exam_board = exam_info['exam_board']
+    ctx = CrawlContext()
+    pdfs = await service.get_pdfs(session, subject_url, exam_board, exam_info['source'], ctx)
+    if not pdfs:
+        print(f"No PDFs found for {subject}")
+        return None
+    if not ctx.complete:
+        print(f"Warning: {len(ctx.failed_urls)} folder(s) could not be fetched; "
+              f"the list of papers for {subject} may be incomplete.")
 
-async def process_subjects(session, exam_info):
-    """Process selected subjects and download papers."""
+    subject_dir = os.path.join(
+        exam_board,
+        exam_info['exam_level'],
+        subject.replace('/', '_').replace('&', 'and')
+    )
+
+    os.makedirs(subject_dir, exist_ok=True)
+    return pdfs, subject_dir, ctx.complete
+
+async def process_subjects(session, exam_info, options):
+    """Process selected subjects and sync their papers."""
     if not exam_info:
         return
 
     exam_board = exam_info['exam_board']
-    source = exam_info['source']
     exam_level = exam_info['exam_level']
     subjects = exam_info['subjects']
 
@@ -138,33 +240,40 @@ async def process_subjects(session, exam_info):
             continue
 
         subject = selected_subjects[index - 1]
-        subject_url = subjects[subject]
         print(f"\nProcessing {subject}...")
 
-        pdfs = await service.get_pdfs(session, subject_url, exam_board, source)
-        if not pdfs:
-            print(f"No PDFs found for {subject}")
+        fetched = await fetch_subject(session, exam_info, subject, subjects[subject])
+        if fetched is None:
             continue
+        pdfs, subject_dir, complete = fetched
+        await sync_subject(session, subject, pdfs, subject_dir, exam_board, options, complete)
 
-        subject_dir = os.path.join(
-            exam_board,
-            exam_level,
-            subject.replace('/', '_').replace('&', 'and')
-        )
-
-        os.makedirs(subject_dir, exist_ok=True)
-        await download_selected_pdfs(session, subject, pdfs, subject_dir, exam_board)
-
-async def main_async():
+async def main_async(options):
     """Main async function to run the script."""
     async with aiohttp.ClientSession() as session:
         exam_info = await get_exam_info(session)
-        await process_subjects(session, exam_info)
+        await process_subjects(session, exam_info, options)
+    print(f"\nStorage: {service.blobs.summary()}")
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(
+        description="Download past papers into <board>/<level>/<subject>/ folders. Papers "
+                    "already synced there are only downloaded again if they changed upstream.")
+    parser.add_argument("--full", action="store_true",
+                        help="download every paper again, even those that are unchanged")
+    parser.add_argument("--no-check", action="store_true",
+                        help="trust papers synced before without asking upstream; "
+                             "only fetch new papers")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-hash local papers and fetch those modified or damaged again")
+    return parser.parse_args()
 
 def main():
     """Entry point for the script."""
+    options = parse_args()
     try:
-        asyncio.run(main_async())
+        asyncio.run(main_async(options))
     except KeyboardInterrupt:
         print("\nProcess interrupted by user. Exiting...")
     except Exception as e:  # pylint: disable=broad-exception-caught
@@ -1,11 +1,28 @@
 #!/usr/bin/env python3
 """
 Script to set up the virtual environment and run both backend and frontend servers.
+With --prod, the frontend is built and precompressed instead and served by the
+backend itself, as one process without Node.js at runtime; the build is reused
+while no frontend source changed. Dependency syncing is skipped while
+requirements.txt / package-lock.json are unchanged, and the backend is polled
+for readiness instead of a fixed sleep.
 """
 import os
+import argparse
+import hashlib
 import subprocess
 import sys
 import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_URL = "http://localhost:8000"
+VENV_STAMP = os.path.join(".venv", ".requirements.sha256")
+NODE_STAMP = os.path.join("frontend", "node_modules", ".package-lock.sha256")
+FRONTEND_DIST = os.path.join("frontend", "dist")
+# Written once a build is complete and precompressed
+BUILD_STAMP = os.path.join(FRONTEND_DIST, ".build-complete")
 
 def get_python_executable():
     """Return the path to the python executable in the virtual environment."""
@@ -13,7 +30,29 @@ def get_python_executable():
         return os.path.join(".venv", "Scripts", "python.exe")
     return os.path.join(".venv", "bin", "python")
 
-def setup_venv():
+def file_digest(*paths):
+    """Return a combined SHA-256 of the given files (missing files count as empty)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def is_up_to_date(stamp_path, digest):
+    """Check whether a dependency sync already ran for this digest."""
+    if not os.path.exists(stamp_path):
+        return False
+    with open(stamp_path, "r", encoding="utf-8") as f:
+        return f.read().strip() == digest
+
+def write_stamp(stamp_path, digest):
+    """Remember the digest of the last successful dependency sync."""
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        f.write(digest)
+
+def setup_venv(force=False):
     """Create a virtual environment if it doesn't exist and install dependencies."""
     if not os.path.exists(".venv"):
         print("🛠️  Creating virtual environment (.venv)...")
@@ -22,6 +61,10 @@ def setup_venv():
         )  # nosec
 
     python_exe = get_python_executable()
+    digest = file_digest("requirements.txt")
+    if not force and is_up_to_date(VENV_STAMP, digest):
+        print("✅ Python dependencies unchanged, skipping sync.")
+        return
 
     print("📦  Syncing Python dependencies...")
     subprocess.run(
@@ -30,39 +73,103 @@ def setup_venv():
     subprocess.run(
         [python_exe, "-m", "pip", "install", "-r", "requirements.txt"], check=True
     )  # nosec
+    write_stamp(VENV_STAMP, digest)
 
-def run_app():
-    # pylint: disable=too-many-branches
-    """Start both backend and frontend servers and monitor them."""
-    python_exe = get_python_executable()
-    is_windows = os.name == 'nt'
+def setup_frontend(force=False):
+    """Install frontend dependencies when package-lock.json changed."""
+    digest = file_digest(os.path.join("frontend", "package.json"),
+                         os.path.join("frontend", "package-lock.json"))
+    if not force and is_up_to_date(NODE_STAMP, digest):
+        print("✅ Frontend dependencies unchanged, skipping npm install.")
+        return
 
-    # 1. Start the Backend
-    print("🚀 Starting Backend (FastAPI)...")
+    print("📦 Installing frontend dependencies...")
+    npm = "npm.cmd" if os.name == 'nt' else "npm"
+    subprocess.run(
+        [npm, "install"], cwd="frontend", check=True
+    )  # nosec
+    write_stamp(NODE_STAMP, digest)
+
+def newest_frontend_source():
+    """Return the latest modification time of the files a frontend build reads."""
+    newest = 0.0
+    for entry in os.scandir("frontend"):
+        if entry.is_file():
+            newest = max(newest, entry.stat().st_mtime)
+    for folder in ("src", "public"):
+        for root, _, files in os.walk(os.path.join("frontend", folder)):
+            for name in files:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+    return newest
+
+def build_is_current():
+    """Check whether the last complete build is newer than every frontend source."""
+    return (os.path.exists(BUILD_STAMP)
+            and os.path.getmtime(BUILD_STAMP) > newest_frontend_source())
+
+def build_frontend(force=False):
+    """Build the frontend for production and precompress its text files."""
+    if not force and build_is_current():
+        print("✅ Frontend build is up to date, skipping build.")
+        return
+
+    print("🏗️  Building frontend (Vite)...")
+    npm = "npm.cmd" if os.name == 'nt' else "npm"
+    subprocess.run(
+        [npm, "run", "build"], cwd="frontend", check=True
+    )  # nosec
+    subprocess.run(
+        [get_python_executable(), os.path.join("backend", "frontend.py"), FRONTEND_DIST],
+        check=True
+    )  # nosec
+    with open(BUILD_STAMP, "w", encoding="utf-8"):
+        pass
+
+def start_backend(env=None):
+    """Start uvicorn on port 8000."""
     # We do not pipe stdout/stderr to avoid buffer saturation issues on Windows.
     # Logs will flow naturally to the console.
     # pylint: disable=consider-using-with
-    backend_proc = subprocess.Popen(
-        [python_exe, "-m", "uvicorn", "main:app", "--app-dir", "backend", "--port", "8000"],
-        bufsize=1
+    return subprocess.Popen(
+        [get_python_executable(), "-m", "uvicorn", "main:app", "--app-dir", "backend",
+         "--port", "8000"],
+        bufsize=1, env=env
     ) # nosec
 
+def wait_for_backend(backend_proc, timeout=60):
+    """Poll the backend health endpoint until it answers or the process dies."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if backend_proc.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"{BACKEND_URL}/health", timeout=1) as res:  # nosec
+                if res.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.1)
+    return False
+
+def run_app(frontend_setup=None):
+    # pylint: disable=too-many-branches
+    """Start both backend and frontend servers and monitor them.
+
+    frontend_setup is an optional future for a frontend dependency install
+    that runs in parallel with the backend starting up.
+    """
+    is_windows = os.name == 'nt'
+
+    # 1. Start the Backend
+    print("🚀 Starting Backend (FastAPI)...")
+    backend_proc = start_backend()
+
     try:
-        # 2. Wait for backend to be ready
-        time.sleep(2)
-
-        # 3. Check/Start the Frontend
-        if not os.path.exists("frontend/node_modules"):
-            print("📦 node_modules not found. Installing frontend dependencies...")
-            if is_windows:
-                subprocess.run(
-                    ["npm.cmd", "install"], cwd="frontend", check=True
-                )  # nosec
-            else:
-                subprocess.run(
-                    ["npm", "install"], cwd="frontend", check=True
-                )  # nosec
+        # 2. Make sure frontend dependencies are in place
+        if frontend_setup is not None:
+            frontend_setup.result()
 
+        # 3. Start the Frontend while the backend finishes booting
         print("💻 Starting Frontend (Vite)...")
         # Check if Node.js supports --disable-warning=DEP0205 via feature detection
         node_env = os.environ.copy()
@@ -96,6 +203,11 @@ def run_app():
                 env=node_env
             )  # nosec
 
+        # 4. Wait for backend to be ready
+        if not wait_for_backend(backend_proc):
+            print("❌ Backend did not become ready.")
+            return
+
         print("\n" + "="*40)
         print("✅ Application is running!")
         print("👉 Backend:  http://localhost:8000")
@@ -122,10 +234,54 @@ def run_app():
             frontend_proc.terminate()
         print("👋 Goodbye!")
 
+def run_prod():
+    """Serve the built frontend and the API from a single backend process."""
+    print("🚀 Starting Backend (FastAPI) with the built frontend...")
+    env = dict(os.environ, EXAMQUEST_FRONTEND_DIST=os.path.abspath(FRONTEND_DIST))
+    backend_proc = start_backend(env)
+    try:
+        if not wait_for_backend(backend_proc):
+            print("❌ Backend did not become ready.")
+            return
+
+        print("\n" + "="*40)
+        print("✅ Application is running!")
+        print(f"👉 App: {BACKEND_URL}")
+        print("="*40)
+        print("\nPress Ctrl+C to stop the server.\n")
+        backend_proc.wait()
+        print("❌ Backend stopped unexpectedly.")
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping server...")
+    finally:
+        if backend_proc.poll() is None:
+            backend_proc.terminate()
+        print("👋 Goodbye!")
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Run the ExamQuest backend and frontend.")
+    parser.add_argument("--force-sync", action="store_true",
+                        help="reinstall dependencies even if lock files are unchanged")
+    parser.add_argument("--prod", action="store_true",
+                        help="build the frontend and serve it from the backend, without Vite")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="with --prod, build the frontend even if no source changed")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        setup_venv()
-        run_app()
+        # Frontend install runs alongside the Python sync and backend startup
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            npm_setup = pool.submit(setup_frontend, args.force_sync)
+            setup_venv(args.force_sync)
+            if args.prod:
+                npm_setup.result()
+                build_frontend(args.rebuild)
+                run_prod()
+            else:
+                run_app(npm_setup)
     except Exception as e: # pylint: disable=broad-exception-caught
         print(f"❌ Error during startup: {e}")
         sys.exit(1)
@@ -0,0 +1,78 @@
+"""
+Tests of the content-addressed paper store.
+"""
+import hashlib
+import os
+
+import pytest
+
+from backend.blobs import BlobStore
+from backend.shared_state import StateStore
+
+PAPER = b'%PDF-1.7 question paper'
+URL = 'https://papers.xtremepape.rs/CAIE/9702_s24_qp_11.pdf'
+MIRROR_URL = 'https://pastpapers.co/caie/9702_s24_qp_11.pdf'
+
+
+@pytest.fixture(name='blobs')
+def blobs_fixture(tmp_path):
+    """A blob store under tmp_path."""
+    return BlobStore(str(tmp_path / 'blobs'), StateStore(str(tmp_path / 'state.sqlite3')))
+
+
+def download(blobs: BlobStore, url: str, body: bytes = PAPER) -> str:
+    """Store body as a finished download of url, like the service does; return its path."""
+    path = os.path.join(os.path.dirname(blobs.root),
+                        hashlib.sha256(url.encode()).hexdigest() + '.pdf')
+    with open(f"{path}.part", 'wb') as f:
+        f.write(body)
+    digest = hashlib.sha256(body).hexdigest()
+    blobs.store(f"{path}.part", path, digest, url)
+    blobs.state.paper_add(digest, url, os.path.basename(url))
+    return path
+
+
+def test_only_another_url_counts_as_a_duplicate(blobs):
+    """Downloading the same URL again saves nothing; the same paper elsewhere does."""
+    path = download(blobs, URL)
+    download(blobs, URL)
+    os.remove(path)
+    download(blobs, URL)
+    assert blobs.report()['duplicates'] == 0
+    download(blobs, MIRROR_URL)
+    assert blobs.report()['duplicates'] == 1
+    assert blobs.report()['bytes_saved'] == len(PAPER)
+
+
+def test_blob_goes_with_its_last_link(blobs):
+    """Unlinking a paper keeps its blob while another path still links to it."""
+    path = download(blobs, URL)
+    mirror_path = download(blobs, MIRROR_URL)
+    blob = blobs.blob_path(hashlib.sha256(PAPER).hexdigest())
+    blobs.unlink(path)
+    assert os.path.exists(blob)
+    blobs.unlink(mirror_path)
+    assert not os.listdir(blobs.root)
+
+
+def test_new_version_replaces_the_old_blob(blobs):
+    """A paper updated upstream leaves no blob of its old version behind."""
+    path = download(blobs, URL)
+    download(blobs, URL, PAPER + b' (corrected)')
+    with open(path, 'rb') as f:
+        assert f.read() == PAPER + b' (corrected)'
+    new_blob = blobs.blob_path(hashlib.sha256(PAPER + b' (corrected)').hexdigest())
+    assert os.listdir(blobs.root) == [os.path.basename(new_blob)]
+
+
+def test_without_hard_links_the_download_is_kept_once(blobs, monkeypatch):
+    """Where links fail, the part file becomes the cached paper and no blob is copied."""
+    def no_links(_src, _dst):
+        raise OSError("hard links are not supported")
+
+    monkeypatch.setattr(os, 'link', no_links)
+    path = download(blobs, URL)
+    with open(path, 'rb') as f:
+        assert f.read() == PAPER
+    assert not os.path.exists(f"{path}.part")
+    assert not os.listdir(blobs.root)
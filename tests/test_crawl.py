@@ -0,0 +1,197 @@
+"""
+Tests of the folder walk and of subject crawls against a local stand-in for
+xtremepapers.
+"""
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from backend.crawl import CrawlContext, walk_folders
+from backend.scraper_service import ExamScraperService
+
+SUBJECT_URL = 'https://papers.xtremepape.rs/index.php?dirpath=./Edexcel/Physics/&order=0'
+YEARS = 20
+
+
+def tree_visitor(fanout: int, depth: int, visited: list, delay: float = 0):
+    """Return a visit() over a tree of folders named by their path, one record each."""
+    running, most_running = [0], [0]
+
+    async def visit(folder: tuple):
+        visited.append(folder)
+        running[0] += 1
+        most_running[0] = max(most_running[0], running[0])
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            running[0] -= 1
+        children = [folder + (i,) for i in range(fanout)] if len(folder) < depth else []
+        return [folder], children
+
+    visit.most_running = most_running
+    return visit
+
+
+def walk(visit, **kwargs) -> list:
+    """Walk the tree from its root and return the records in the order yielded."""
+    async def run():
+        return [record async for record in walk_folders((), visit, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_walk_visits_every_folder_once_with_bounded_workers():
+    """All folders are found, however small the frontier, with at most `workers` at once."""
+    visited = []
+    visit = tree_visitor(4, 3, visited, delay=0.001)
+    records = walk(visit, workers=3, max_frontier=5)
+    assert len(records) == len(set(records)) == 1 + 4 + 16 + 64
+    assert sorted(visited) == sorted(records)
+    assert visit.most_running[0] == 3
+
+
+def test_frontier_overflow_is_walked_depth_first():
+    """A folder that finds the frontier full is visited by its finder, depth first."""
+    breadth_first = walk(tree_visitor(2, 2, []), workers=1)
+    assert breadth_first == [(), (0,), (1,), (0, 0), (0, 1), (1, 0), (1, 1)]
+    depth_first = walk(tree_visitor(2, 2, []), workers=1, max_frontier=0)
+    assert depth_first == [(), (0,), (0, 0), (0, 1), (1,), (1, 0), (1, 1)]
+
+
+def test_slow_consumer_pauses_the_walk_and_closing_stops_it():
+    """Workers stop once max_buffered records wait, and stop for good when closed."""
+    visited = []
+
+    async def run():
+        records = walk_folders((), tree_visitor(10, 2, visited), workers=2, max_buffered=5)
+        await anext(records)
+        await asyncio.sleep(0.05)
+        paused_at = len(visited)
+        await records.aclose()
+        await asyncio.sleep(0.05)
+        return paused_at
+
+    paused_at = asyncio.run(run())
+    # The buffer, one record taken, and one blocked put per worker
+    assert paused_at <= 5 + 1 + 2
+    assert len(visited) == paused_at
+
+
+def test_visit_failure_is_raised_to_the_consumer():
+    """An exception in a visit ends the walk and reaches whoever iterates it."""
+    async def visit(folder: tuple):
+        if folder == (1,):
+            raise ValueError("unreadable folder")
+        return [folder], [folder + (i,) for i in range(3)] if not folder else []
+
+    with pytest.raises(ValueError):
+        walk(visit)
+
+
+async def fake_xtremepapers(request: web.Request) -> web.Response:
+    """Serve an Edexcel subject of YEARS year folders with one paper each."""
+    dirpath = request.query.get('dirpath', '')
+    if dirpath == './Edexcel/Physics/':
+        links = ''.join(f'<a class="directory" href="index.php?dirpath=./Edexcel/Physics/'
+                        f'{2000 + year}/">[{2000 + year}]</a>' for year in range(YEARS))
+    else:
+        year = dirpath.rstrip('/').rsplit('/', 1)[-1]
+        links = f'<a class="file" href="papers/{year}/paper_{year}.pdf">paper_{year}.pdf</a>'
+    return web.Response(text=f'<html><body>{links}</body></html>', content_type='text/html')
+
+
+def against(tmp_path, monkeypatch, handler, scrape):
+    """Run scrape(service, session) with every upstream request answered by handler."""
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{host}/{tail:.*}', handler)
+        async with TestServer(app) as server:
+            service = ExamScraperService(state_path=str(tmp_path / 'state.sqlite3'),
+                                         jitter=(0, 0),
+                                         upstream_override=str(server.make_url('')))
+            async with aiohttp.ClientSession() as session:
+                return service, await scrape(service, session)
+
+    return asyncio.run(run())
+
+
+def crawl(tmp_path, monkeypatch, ctx: CrawlContext, handler=fake_xtremepapers) -> dict:
+    """Crawl the fake subject with ctx and return the papers found."""
+    _, papers = against(tmp_path, monkeypatch, handler,
+                        lambda service, session: service.get_pdfs(
+                            session, SUBJECT_URL, 'Edexcel', 'xtremepapers', ctx))
+    return papers
+
+
+def test_unlimited_crawl_is_complete(tmp_path, monkeypatch):
+    """Without a budget every folder is fetched."""
+    ctx = CrawlContext()
+    papers = crawl(tmp_path, monkeypatch, ctx)
+    assert len(papers) == YEARS
+    assert ctx.complete and ctx.upstream_requests == YEARS + 1
+
+
+def test_crawl_stops_at_its_budget(tmp_path, monkeypatch):
+    """A crawl never sends more requests than its budget, and is then incomplete."""
+    ctx = CrawlContext(budget=5)
+    papers = crawl(tmp_path, monkeypatch, ctx)
+    assert ctx.upstream_requests == 5
+    assert len(papers) == 4
+    assert not ctx.complete
+
+
+def test_missing_folder_is_empty_not_failed(tmp_path, monkeypatch):
+    """A folder answering 404 has no papers, but the crawl is still complete."""
+    async def handler(request: web.Request) -> web.Response:
+        if request.query.get('dirpath', '').endswith('/2003/'):
+            raise web.HTTPNotFound()
+        return await fake_xtremepapers(request)
+
+    ctx = CrawlContext()
+    papers = crawl(tmp_path, monkeypatch, ctx, handler)
+    assert len(papers) == YEARS - 1 and 'paper_2003.pdf' not in papers
+    assert ctx.complete and ctx.upstream_requests == YEARS + 1
+
+
+def test_forbidden_page_fetched_with_fallback_closes_the_breaker(tmp_path, monkeypatch):
+    """A 403 answered by the fallback request counts as the host recovering."""
+    host = 'papers.xtremepape.rs'
+
+    async def handler(request: web.Request) -> web.Response:
+        if request.headers.get('Referer') != 'https://www.google.com/':
+            raise web.HTTPForbidden()
+        return await fake_xtremepapers(request)
+
+    async def scrape(service, session):
+        for _ in range(service.breaker.threshold - 1):
+            service.breaker.record_failure(host)
+        # The subject page lists the year folders
+        return await service.get_xtremepapers_subjects(session, 'Edexcel', 'Physics')
+
+    service, folders = against(tmp_path, monkeypatch, handler, scrape)
+    assert len(folders) == YEARS
+    # The failures before are forgotten, so one more does not open the circuit
+    service.breaker.record_failure(host)
+    assert not service.breaker.is_open(host)
+
+
+def test_paper_in_two_folders_is_listed_once(tmp_path, monkeypatch):
+    """A filename found in two folders is yielded once, as /papers lists it."""
+    async def handler(request: web.Request) -> web.Response:
+        response = await fake_xtremepapers(request)
+        if request.query.get('dirpath', '').rstrip('/')[-4:] in ('2000', '2001'):
+            year = request.query['dirpath'].rstrip('/')[-4:]
+            response.text += f'<a class="file" href="papers/{year}/errata.pdf">errata.pdf</a>'
+        return response
+
+    async def scrape(service, session):
+        return [record async for record in service.iter_pdfs(
+            session, SUBJECT_URL, 'Edexcel', 'xtremepapers', CrawlContext())]
+
+    _, records = against(tmp_path, monkeypatch, handler, scrape)
+    names = [filename for filename, _ in records]
+    assert len(names) == len(set(names)) == YEARS + 1
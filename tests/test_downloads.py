@@ -0,0 +1,82 @@
+"""
+Tests of readers following an in-flight download.
+"""
+import asyncio
+import os
+
+import pytest
+
+from backend.diskio import DiskIO
+from backend.downloads import InFlightDownload
+from backend.scheduler import QueueFull
+
+BODY = bytes(range(256)) * 1024
+
+
+async def read_all(download: InFlightDownload) -> bytes:
+    """Return every byte a reader joining now is sent."""
+    return b"".join([chunk async for chunk in download.iter_chunks()])
+
+
+async def write(download: InFlightDownload, body: bytes, chunks: int):
+    """Write body into the part file in chunks, letting readers run in between."""
+    await download.start(len(body))
+    step = len(body) // chunks
+    with open(download.part_path, 'wb') as f:
+        for offset in range(0, len(body), step):
+            f.write(body[offset:offset + step])
+            f.flush()
+            await download.wrote(len(body[offset:offset + step]))
+            await asyncio.sleep(0.005)
+
+
+def test_readers_joining_at_any_time_get_the_whole_paper(tmp_path):
+    """Readers before, during and after the transfer all get every byte once."""
+    async def run():
+        download = InFlightDownload(str(tmp_path / 'paper.pdf'), DiskIO(threads=2))
+        early = asyncio.create_task(read_all(download))
+        writer = asyncio.create_task(write(download, BODY, 8))
+        await asyncio.sleep(0.02)
+        during = asyncio.create_task(read_all(download))
+        await writer
+        # The finished part file becomes the cached paper, as the service does
+        os.replace(download.part_path, download.path)
+        await download.finish()
+        return await download.wait(), await asyncio.gather(early, during,
+                                                           read_all(download))
+
+    path, bodies = asyncio.run(run())
+    assert path == str(tmp_path / 'paper.pdf')
+    assert bodies == [BODY] * 3
+
+
+def test_failure_reaches_every_reader(tmp_path):
+    """A transfer failing half way fails readers following it and waiting requesters."""
+    async def run():
+        download = InFlightDownload(str(tmp_path / 'paper.pdf'), DiskIO(threads=2))
+        await download.start(len(BODY))
+        with open(download.part_path, 'wb') as f:
+            f.write(BODY[:1000])
+        await download.wrote(1000)
+        readers = [asyncio.create_task(read_all(download)) for _ in range(3)]
+        waiter = asyncio.create_task(download.wait())
+        await asyncio.sleep(0.02)
+        await download.fail(ConnectionResetError("mirror hung up"))
+        return await asyncio.gather(*readers, waiter, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(results) == 4
+    for result in results:
+        assert isinstance(result, RuntimeError)
+        assert isinstance(result.__cause__, ConnectionResetError)
+
+
+def test_refused_download_is_raised_as_is(tmp_path):
+    """A download refused by the scheduler stays a QueueFull, so requesters get a 429."""
+    async def run():
+        download = InFlightDownload(str(tmp_path / 'paper.pdf'), DiskIO(threads=1))
+        await download.fail(QueueFull(5))
+        await download.wait_started()
+
+    with pytest.raises(QueueFull):
+        asyncio.run(run())
@@ -0,0 +1,62 @@
+"""
+Tests of full-text search over downloaded papers.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from backend.fulltext import FullTextIndex
+from backend.shared_state import StateStore
+
+
+def text_pdf(pages: list) -> bytes:
+    """Return a PDF with one page per string of pages, showing that text."""
+    writer = PdfWriter()
+    font = DictionaryObject({NameObject('/Type'): NameObject('/Font'),
+                             NameObject('/Subtype'): NameObject('/Type1'),
+                             NameObject('/BaseFont'): NameObject('/Helvetica')})
+    for text in pages:
+        page = writer.add_blank_page(600, 800)
+        page[NameObject('/Resources')] = DictionaryObject(
+            {NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+        content = DecodedStreamObject()
+        content.set_data(b'BT /F1 12 Tf 72 700 Td (%s) Tj ET' % text.encode())
+        page.replace_contents(content)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def test_limit_counts_papers_not_pages(tmp_path):
+    """A paper matching on many pages takes one place in the results, with all its pages."""
+    blob_root = tmp_path / 'blobs'
+    blob_root.mkdir()
+    state = StateStore(str(tmp_path / 'state.sqlite3'))
+    papers = {
+        # Pages of a rank first: only a's would fit in a limit counting pages
+        'a' * 64: ['momentum momentum momentum'] * 5,
+        'b' * 64: ['momentum of a trolley', 'energy'],
+        'c' * 64: ['energy', 'momentum'],
+        'd' * 64: ['waves'],
+    }
+    for digest, pages in papers.items():
+        (blob_root / f'{digest}.pdf').write_bytes(text_pdf(pages))
+        state.paper_add(digest, f'https://pastpapers.co/caie/{digest[0]}.pdf', f'{digest[0]}.pdf')
+
+    index = FullTextIndex(state, str(blob_root), path=str(tmp_path / 'fulltext.sqlite3'))
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert asyncio.run(index.refresh(pool)) == len(papers)
+
+    results = index.search('momentum', limit=2)
+    assert len(results) == 2
+    assert len({result['papers'][0]['name'] for result in results}) == 2
+    assert all(result['pages'] for result in results)
+    every_hit = index.search('momentum')
+    assert len(every_hit) == 3
+    pages = {os.path.splitext(result['papers'][0]['name'])[0]: len(result['pages'])
+             for result in every_hit}
+    assert pages == {'a': 5, 'b': 1, 'c': 1}
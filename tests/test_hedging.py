@@ -0,0 +1,61 @@
+"""
+Tests of hedged downloads staying within the upstream concurrency limit.
+"""
+import asyncio
+from unittest.mock import Mock
+
+from backend.hedging import HedgedOpener
+from backend.scheduler import FairScheduler
+from backend.shared_state import SharedSemaphore, StateStore
+
+SLOW = 'https://papers.xtremepape.rs/CAIE/9702_s24_qp_11.pdf'
+FAST = 'https://pastpapers.co/caie/9702_s24_qp_11.pdf'
+
+
+def race(tmp_path, slots: int, delays: dict):
+    """Race SLOW then FAST with the given answer delays; return what happened."""
+    opened, in_flight, most_in_flight = [], [0], [0]
+
+    async def open_mirror(_session, url):
+        opened.append(url)
+        in_flight[0] += 1
+        most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+        try:
+            await asyncio.sleep(delays[url])
+            return Mock()
+        finally:
+            in_flight[0] -= 1
+
+    async def run():
+        scheduler = FairScheduler(slots)
+        semaphore = SharedSemaphore(StateStore(str(tmp_path / 'state.sqlite3')), 'upstream',
+                                    slots, local=scheduler)
+        # Every mirror is hedged after 50 ms
+        stats = Mock(hedge_delay=Mock(return_value=0.05))
+        opener = HedgedOpener(open_mirror, semaphore.acquire, semaphore.release, stats)
+        response, url, owner = await opener.open(None, [SLOW, FAST], 'paper.pdf')
+        # Reading the body: only the winner's slot is still held
+        assert scheduler.locked() == (slots == 1)
+        await opener.close(response, owner)
+        assert not scheduler.locked()
+        return url, response
+
+    url, response = asyncio.run(run())
+    return {'url': url, 'released': response.release.called, 'opened': opened,
+            'most_in_flight': most_in_flight[0]}
+
+
+def test_hedge_takes_a_free_slot(tmp_path):
+    """A slow mirror is hedged in a second slot, and the faster one wins."""
+    result = race(tmp_path, 2, {SLOW: 1.0, FAST: 0.0})
+    assert result['url'] == FAST and result['released']
+    assert result['opened'] == [SLOW, FAST]
+    assert result['most_in_flight'] == 2
+
+
+def test_no_hedge_without_a_free_slot(tmp_path):
+    """With every slot taken, the download waits for its mirror instead of hedging."""
+    result = race(tmp_path, 1, {SLOW: 0.2, FAST: 0.0})
+    assert result['url'] == SLOW
+    assert result['opened'] == [SLOW]
+    assert result['most_in_flight'] == 1
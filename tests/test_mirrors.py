@@ -0,0 +1,96 @@
+"""
+Tests of the mirror index, of which mirrors a paper download races, and of the
+per-host circuit breaker.
+"""
+import asyncio
+import time
+
+import pytest
+
+from backend.mirrors import CircuitBreaker, MirrorIndex
+from backend.scraper_service import ExamScraperService
+
+PAPER = 'https://papers.xtremepape.rs/CAIE/AS%20and%20A%20Level/Physics/9702_s24_qp_11.pdf'
+SAME_PAPER = 'https://pastpapers.co/caie/A-Level/Physics-9702/2024/9702_s24_qp_11.pdf'
+OTHER_PAPER = 'https://pastpapers.co/caie/A-Level/Physics-9702/2024/9702_s24_qp_12.pdf'
+
+
+@pytest.fixture(name='service')
+def service_fixture(tmp_path, monkeypatch):
+    """A scraper service keeping its downloads and state under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    return ExamScraperService(state_path=str(tmp_path / 'state.sqlite3'), jitter=(0, 0))
+
+
+def raced_urls(service: ExamScraperService, url: str) -> list:
+    """Download url with every mirror failing; return the URLs that were tried."""
+    raced = []
+
+    async def open_hedged(_session, candidates, filename):
+        raced.extend(candidates)
+        raise RuntimeError(f"Failed to download {filename}: offline test")
+
+    service.hedged.open = open_hedged
+
+    async def download():
+        with pytest.raises(RuntimeError):
+            await service.download_paper(None, url)
+
+    asyncio.run(download())
+    return raced
+
+
+def test_index_knows_papers_by_url():
+    """Alternates are the same file name on other hosts; generic names have none."""
+    index = MirrorIndex()
+    for url in (PAPER, SAME_PAPER, OTHER_PAPER, 'https://pastpapers.co/caie/specimen.pdf'):
+        index.register(url)
+    assert index.alternates(PAPER) == [SAME_PAPER]
+    assert index.alternates(SAME_PAPER) == [PAPER]
+    assert not index.alternates('https://papers.xtremepape.rs/CAIE/specimen.pdf')
+
+
+def test_download_races_mirrors_of_its_own_paper(service):
+    """A crawled mirror of the requested paper is raced, another paper never is."""
+    service.mirror_index.register(SAME_PAPER)
+    service.mirror_index.register(OTHER_PAPER)
+    assert sorted(raced_urls(service, PAPER)) == sorted([PAPER, SAME_PAPER])
+
+
+def test_downloads_do_not_register_mirrors(service):
+    """A requested URL never becomes a mirror of a paper, whatever it is called."""
+    service.mirror_index.register(OTHER_PAPER)
+    raced_urls(service, PAPER)
+    raced_urls(service, SAME_PAPER)
+    assert raced_urls(service, OTHER_PAPER) == [OTHER_PAPER]
+
+
+def test_breaker_opens_after_consecutive_failures():
+    """A success resets the count; threshold failures in a row open the circuit."""
+    breaker = CircuitBreaker(threshold=3, cooldown=30)
+    for _ in range(2):
+        breaker.record_failure('a')
+    breaker.record_success('a')
+    breaker.record_failure('a')
+    assert breaker.allow('a')
+    breaker.record_failure('a')
+    breaker.record_failure('a')
+    assert breaker.is_open('a') and not breaker.allow('a')
+    # Hosts are independent
+    assert breaker.allow('b')
+
+
+def test_breaker_lets_one_probe_through_after_cooldown():
+    """Once cooled down, a single probe decides whether the circuit closes again."""
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure('a')
+    assert not breaker.allow('a')
+    time.sleep(0.06)
+    assert breaker.allow('a')
+    assert not breaker.allow('a')
+    breaker.record_failure('a')
+    assert not breaker.allow('a')
+    time.sleep(0.06)
+    assert breaker.allow('a')
+    breaker.record_success('a')
+    assert breaker.allow('a') and breaker.allow('a')
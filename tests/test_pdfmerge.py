@@ -0,0 +1,91 @@
+"""
+Tests of the streaming PDF merger.
+"""
+import io
+
+from pypdf import PdfReader, PdfWriter
+
+from backend.pdfmerge import StreamingPdfMerger
+
+CONTENT = b'BT /F1 24 Tf 72 500 Td (Hello inherited) Tj ET'
+
+
+def inherited_attributes_pdf() -> bytes:
+    """Return a PDF whose only page inherits everything from its /Pages nodes.
+
+    The root /Pages node defines MediaBox and Rotate, an intermediate one
+    the Resources; the page itself only has its Contents.
+    """
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 /MediaBox [0 0 300 600] /Rotate 90 >>',
+        b'<< /Type /Pages /Parent 2 0 R /Kids [4 0 R] /Count 1 '
+        b'/Resources << /Font << /F1 6 0 R >> >> >>',
+        b'<< /Type /Page /Parent 3 0 R /Contents 5 0 R >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(CONTENT), CONTENT),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = io.BytesIO()
+    out.write(b'%PDF-1.7\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+              % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def blank_pdf(width: float, height: float) -> bytes:
+    """Return a PDF with one blank page of the given size."""
+    writer = PdfWriter()
+    writer.add_blank_page(width, height)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def merge(tmp_path, *inputs: bytes) -> PdfReader:
+    """Stream-merge PDFs given as bytes and return a reader of the result."""
+    merged = io.BytesIO()
+    merger = StreamingPdfMerger(merged)
+    for index, data in enumerate(inputs):
+        path = tmp_path / f"input_{index}.pdf"
+        path.write_bytes(data)
+        merger.append(str(path))
+    merger.close()
+    return PdfReader(io.BytesIO(merged.getvalue()))
+
+
+def test_fixture_inherits_from_page_tree():
+    """The fixture's page defines none of the attributes it inherits."""
+    reader = PdfReader(io.BytesIO(inherited_attributes_pdf()))
+    # As stored, not as reader.pages presents it with inherited attributes filled in
+    page = reader.get_object(4)
+    assert '/MediaBox' not in page and '/Resources' not in page
+    assert 'Hello inherited' in reader.get_page(0).extract_text()
+
+
+def test_inherited_attributes_are_copied_to_pages(tmp_path):
+    """Merged pages carry what they inherited from their input's page tree."""
+    reader = merge(tmp_path, inherited_attributes_pdf())
+    page = reader.get_page(0)
+    assert [float(v) for v in page['/MediaBox']] == [0, 0, 300, 600]
+    assert page['/Rotate'] == 90
+    assert '/F1' in page['/Resources']['/Font']
+    assert 'Hello inherited' in page.extract_text()
+
+
+def test_pages_keep_their_own_attributes(tmp_path):
+    """Inheritance from one input does not leak to the pages of another."""
+    reader = merge(tmp_path, blank_pdf(200, 100), inherited_attributes_pdf(),
+                   blank_pdf(400, 800))
+    assert len(reader.pages) == 3
+    assert [float(v) for v in reader.get_page(0).mediabox] == [0, 0, 200, 100]
+    assert [float(v) for v in reader.get_page(2).mediabox] == [0, 0, 400, 800]
+    assert '/Rotate' not in reader.get_page(2)
+    assert 'Hello inherited' in reader.get_page(1).extract_text()
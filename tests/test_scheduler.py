@@ -0,0 +1,131 @@
+"""
+Tests of upstream admission and fair scheduling, alone and behind the API.
+"""
+import asyncio
+import importlib
+import socket
+
+import aiohttp
+import pytest
+import uvicorn
+
+from backend.scheduler import FairScheduler, Priority, QueueFull, work_context
+
+
+def test_admitted_requests_hold_their_place_until_they_leave():
+    """Places are reserved at admission, so a burst cannot all get in at once."""
+    scheduler = FairScheduler(2, max_queue=4, max_per_client=3)
+    for _ in range(3):
+        scheduler.admit(Priority.INTERACTIVE, 'a')
+    with pytest.raises(QueueFull):
+        scheduler.admit(Priority.INTERACTIVE, 'a')
+    scheduler.admit(Priority.INTERACTIVE, 'b')
+    with pytest.raises(QueueFull):
+        scheduler.admit(Priority.INTERACTIVE, 'b')
+    scheduler.leave('a')
+    scheduler.admit(Priority.INTERACTIVE, 'b')
+
+
+def test_lower_classes_get_fewer_places():
+    """Bulk work may take half the places, prefetching a quarter."""
+    scheduler = FairScheduler(2, max_queue=4)
+    scheduler.admit(Priority.PREFETCH, 'warmer')
+    with pytest.raises(QueueFull):
+        scheduler.admit(Priority.PREFETCH, 'warmer')
+    scheduler.admit(Priority.BULK, 'a')
+    with pytest.raises(QueueFull):
+        scheduler.admit(Priority.BULK, 'b')
+    scheduler.admit(Priority.INTERACTIVE, 'b')
+    scheduler.admit(Priority.INTERACTIVE, 'c')
+
+
+def test_waiters_take_turns_by_class_then_client():
+    """Interactive clients alternate, and bulk work waits until they are served."""
+    granted = []
+
+    async def run():
+        scheduler = FairScheduler(1)
+        await scheduler.acquire()
+
+        async def wait(name: str, priority: Priority, client: str):
+            with work_context(priority, client, admitted=True):
+                await scheduler.acquire()
+            granted.append(name)
+
+        waiters = [('bulk', Priority.BULK, 'c'), ('a1', Priority.INTERACTIVE, 'a'),
+                   ('a2', Priority.INTERACTIVE, 'a'), ('a3', Priority.INTERACTIVE, 'a'),
+                   ('b1', Priority.INTERACTIVE, 'b')]
+        tasks = []
+        for waiter in waiters:
+            tasks.append(asyncio.create_task(wait(*waiter)))
+            await asyncio.sleep(0)
+        for _ in waiters:
+            scheduler.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert granted == ['a1', 'b1', 'a2', 'a3', 'bulk']
+
+
+def test_waiting_prefetch_takes_a_place():
+    """Work queued without an admitted request still counts against the limit."""
+    async def run():
+        scheduler = FairScheduler(1, max_queue=4)
+        await scheduler.acquire()
+        with work_context(Priority.PREFETCH, 'warmer'):
+            prefetch = asyncio.create_task(scheduler.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFull):
+                await scheduler.acquire()
+        scheduler.release()
+        await prefetch
+        # Granted: its place is free again
+        scheduler.admit(Priority.PREFETCH, 'warmer')
+
+    asyncio.run(run())
+
+
+def test_burst_above_the_limit_gets_429(tmp_path, monkeypatch):
+    """Of a burst of concurrent upstream requests, only max_queue are let in."""
+    monkeypatch.chdir(tmp_path)
+    for name, value in (('EXAMQUEST_MAX_QUEUE', '10'), ('EXAMQUEST_WARMER', '0'),
+                        ('EXAMQUEST_INDEX', '0')):
+        monkeypatch.setenv(name, value)
+    main = importlib.import_module('backend.main')
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow_subjects(_session, _board, _level):
+            await release.wait()
+            return {'Physics': 'https://papers.xtremepape.rs/index.php?dirpath=./CAIE/Physics/'}
+
+        monkeypatch.setattr(main.service, 'get_xtremepapers_subjects', slow_subjects)
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        server = uvicorn.Server(uvicorn.Config(main.app, log_level='warning'))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            await asyncio.sleep(0.01)
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/subjects"
+
+        async with aiohttp.ClientSession() as session:
+            async def get(level: int) -> int:
+                params = {'source': 'xtremepapers', 'board': 'CAIE', 'level': str(level)}
+                async with session.get(url, params=params) as response:
+                    return response.status
+
+            burst = [asyncio.create_task(get(level)) for level in range(30)]
+            await asyncio.sleep(0.5)
+            release.set()
+            statuses = await asyncio.gather(*burst)
+            # Every admitted request has left: the next one gets in
+            after = await get(100)
+        server.should_exit = True
+        await serving
+        return statuses, after
+
+    statuses, after = asyncio.run(run())
+    assert statuses.count(200) == 10 and statuses.count(429) == 20
+    assert after == 200
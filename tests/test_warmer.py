@@ -0,0 +1,75 @@
+"""
+Tests of the cache warmer's upstream budget and leader lease.
+"""
+import asyncio
+import time
+from unittest.mock import Mock
+
+from backend.shared_state import StateStore
+from backend.warmer import CacheWarmer
+
+
+def make_warmer(tmp_path, warm_listing, budget: int = 10) -> CacheWarmer:
+    """Return a warmer of three popular subjects over a fresh state store."""
+    service = Mock(state=StateStore(str(tmp_path / 'state.sqlite3')), upstream_requests=0)
+    warmer = CacheWarmer(service, warm_listing, budget=budget, quiet_seconds=0, interval=60)
+    for index in range(3):
+        warmer.record_subject('xtremepapers', 'CAIE', f'https://papers.xtremepape.rs/{index}',
+                              weight=3 - index)
+    return warmer
+
+
+def test_crawls_spend_at_most_the_budget(tmp_path):
+    """Each crawl gets what is left of the budget and is charged its own requests only."""
+    budgets = []
+
+    async def warm_listing(_session, _source, _board, _subject_url, ctx):
+        budgets.append(ctx.budget)
+        # Subjects of 4 pages, crawled while users keep the service busy
+        for _ in range(4):
+            if ctx.exhausted:
+                return False
+            ctx.upstream_requests += 1
+            warmer.service.upstream_requests += 10
+            await asyncio.sleep(0)
+        return True
+
+    warmer = make_warmer(tmp_path, warm_listing, budget=10)
+    assert asyncio.run(warmer.warm_once(None)) == 2
+    assert budgets == [10, 6, 2]
+    assert warmer.remaining_budget() == 0
+
+
+def test_leader_lease_is_renewed_between_items(tmp_path):
+    """A long pass keeps its lease, so no other worker starts warming meanwhile."""
+    expiries = []
+
+    async def warm_listing(_session, _source, _board, _subject_url, ctx):
+        expiries.append(warmer.state.execute(
+            "SELECT expires FROM locks WHERE name = 'warmer:leader'")[0][0])
+        ctx.upstream_requests += 1
+        await asyncio.sleep(0.01)
+        return True
+
+    warmer = make_warmer(tmp_path, warm_listing)
+    assert asyncio.run(warmer.warm_once(None)) == 3
+    assert expiries == sorted(expiries) and len(set(expiries)) == 3
+    assert expiries[-1] > time.time() + warmer.interval * 2
+    assert not warmer.state.try_lock('warmer:leader', 'another worker', 60)
+
+
+def test_counts_are_written_in_batches(tmp_path):
+    """Requests only count in memory; a flush writes them to the store at once."""
+    warmer = make_warmer(tmp_path, None)
+    warmer.record_download('https://papers.xtremepape.rs/CAIE/9702_s24_qp_11.pdf', 'qp.pdf')
+    warmer.note_activity()
+    assert not warmer.state.counter_top('subjects', 10)
+    assert warmer.state.cache_get('warmer:last_activity') is None
+
+    asyncio.run(warmer.flush())
+    assert [count for _, count in warmer.state.counter_top('subjects', 10)] == [3, 2, 1]
+    assert len(warmer.state.counter_top('downloads', 10)) == 1
+    assert warmer.state.cache_get('warmer:last_activity') > time.time() - 60
+    # Nothing new: a second flush adds nothing
+    asyncio.run(warmer.flush())
+    assert [count for _, count in warmer.state.counter_top('subjects', 10)] == [3, 2, 1]